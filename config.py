@@ -9,16 +9,28 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# Snapshot the environment once at import; everything below reads from it
+_ENV = os.environ.copy()
+
+# API Keys (module-level so hot paths skip class attribute lookups)
+OPENAI_API_KEY = _ENV.get("OPENAI_API_KEY")
+GROQ_API_KEY = _ENV.get("GROQ_API_KEY")
+ELEVENLABS_API_KEY = _ENV.get("ELEVENLABS_API_KEY")
+USE_GROQ = _ENV.get("USE_GROQ", "True").lower() == "true"
+
+# Set once validate() has passed, so repeated calls are no-ops
+_VALIDATED = False
+
 class Config:
     """Central configuration class - OPTIMIZED"""
     
     # API Keys
-    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-    GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-    ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
+    OPENAI_API_KEY = OPENAI_API_KEY
+    GROQ_API_KEY = GROQ_API_KEY
+    ELEVENLABS_API_KEY = ELEVENLABS_API_KEY
     
     # Model Selection - OPTIMIZED FOR SPEED
-    USE_GROQ = os.getenv("USE_GROQ", "True").lower() == "true"  # Groq is MUCH faster
+    USE_GROQ = USE_GROQ  # Groq is MUCH faster
     
     # STT Configuration (Whisper)
     WHISPER_MODEL = "whisper-1"
@@ -34,14 +46,14 @@ class Config:
     # "onwK4e9ZLuTAKqWW03F9" - Daniel (calm, wise, male)
     
     
-    ELEVENLABS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "pNInz6obpgDQGcFmaJgB")
+    ELEVENLABS_VOICE_ID = _ENV.get("ELEVENLABS_VOICE_ID", "pNInz6obpgDQGcFmaJgB")
     ELEVENLABS_MODEL = "eleven_turbo_v2_5"  # Fastest model
     
     # OpenAI TTS Voice (Best options for Krishna)
     # nova = warm, gentle, clear (BEST - lightest voice)
     # alloy = neutral, balanced
     # onyx = deep, smooth (too heavy)
-    OPENAI_VOICE = os.getenv("OPENAI_VOICE", "nova") 
+    OPENAI_VOICE = _ENV.get("OPENAI_VOICE", "nova") 
     
     # OPTIMIZED VOICE SETTINGS FOR KRISHNA (deep, spiritual feel)
     ELEVENLABS_STABILITY = 0.82      # Higher stability for steady delivery of verses
@@ -58,28 +70,74 @@ class Config:
         "Daily Struggles"
     ]
     
+    # Intent response cache (repeat queries skip the LLM)
+    INTENT_CACHE_SIZE = 512
+    INTENT_CACHE_TTL = 3600  # seconds
+    INTENT_PROMPT_TOKEN_BUDGET = 900  # Warn at startup if the classifier prompt grows past this
+    
+    # Conversation history sent to the LLM: newest messages up to this many tokens
+    HISTORY_TOKEN_BUDGET = 1500
+    
     # Audio Settings
     SAMPLE_RATE = 16000
     CHANNELS = 1
     SILENCE_THRESHOLD = 500  # milliseconds (Faster auto-trigger)
+    BARGE_IN_PEAK = int(_ENV.get("BARGE_IN_PEAK", "3000"))  # int16 peak a chunk needs to reach STT while Krishna speaks
+    STT_UPLOAD_FLAC = _ENV.get("STT_UPLOAD_FLAC", "True").lower() == "true"  # Groq uploads as FLAC (needs soundfile)
+    STT_FINAL_HEDGE_MS = 1500  # Start OpenAI alongside a slow Groq final after this (adapts to 1.5x Groq's recent latency)
+    PARTIAL_WINDOW_BYTES = 16000 * 2 * 3  # STT partials only transcribe the newest 3 seconds
+    PARTIAL_VAD_MIN_RMS = 300  # STT partials are skipped unless the last 600ms has 3+ frames this loud (and voiced, with webrtcvad)
+    LOG_AUDIO_CHUNKS = _ENV.get("LOG_AUDIO_CHUNKS", "False").lower() == "true"  # Periodic per-chunk progress/level log (debug)
+    LOG_AUDIO_RMS = _ENV.get("LOG_AUDIO_RMS", "False").lower() == "true"  # Add exact RMS to that log
+    
+    # Hedged TTS: when ElevenLabs hasn't produced audio after the head start, OpenAI is
+    # asked too and whichever streams first is used (the other request is cancelled).
+    # Off by default: a hedged sentence costs a second paid request and may be spoken in
+    # OpenAI's voice, so Krishna's voice can change mid-answer
+    HEDGE_TTS = _ENV.get("HEDGE_TTS", "False").lower() == "true"
+    TTS_HEDGE_DELAY_MS = 150
+    
+    # TTS audio cache (repeated short phrases skip the TTS API entirely)
+    TTS_CACHE_DIR = _ENV.get("TTS_CACHE_DIR", "./tts_cache")  # On-disk tier, survives restarts ("" disables it)
+    TTS_CACHE_MEMORY_BYTES = 8 * 1024 * 1024  # In-memory LRU budget (~4 min of 16kHz PCM)
+    TTS_CACHE_DISK_BYTES = 64 * 1024 * 1024  # On-disk budget per process; least recently used files are deleted
+    TTS_CACHE_ADMIT_AFTER = 2  # Cache a phrase on its 2nd request - most LLM sentences never repeat
+    TTS_CACHE_MAX_CHARS = 100  # Longer pieces are not cached
     
     # RAG Configuration - OPEN SOURCE & FAST
-    RAG_ENABLED = os.getenv("RAG_ENABLED", "True").lower() == "true"
+    RAG_ENABLED = _ENV.get("RAG_ENABLED", "True").lower() == "true"
+    LIGHTWEIGHT_RAG = _ENV.get("LIGHTWEIGHT_RAG", "True").lower() == "true"  # Skip ML models (Render free tier)
     EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"  # Fast (16ms) & free
-    VECTOR_DB_PATH = "./chroma_db"
-    COLLECTION_NAME = "bhagavad_gita_verses"
+    EMBEDDING_BACKEND = _ENV.get("EMBEDDING_BACKEND", "torch").lower()  # "torch" or "onnx"
+    EMBEDDING_ONNX_FILE = _ENV.get("EMBEDDING_ONNX_FILE", "onnx/model_qint8_avx2.onnx")  # INT8 query encoder (onnx backend)
+    VECTOR_DB_PATH = "./vector_store"  # embeddings.npy + scales.npy + chunks.json written by rag_embedder.py
+    EMBEDDING_CACHE_PATH = "./embed_cache.db"  # chunk-hash -> vector, skips re-embedding unchanged text
     TOP_K_RETRIEVAL = 3  # Retrieve top 3 most relevant verses
     RAG_SIMILARITY_THRESHOLD = 0.2  # Minimum similarity score (lowered for better recall)
+    # Optional off-topic gate: skip retrieval when query-to-corpus-centroid similarity is below
+    # this (embedding retriever only). Unset = off; calibrate on real queries before enabling
+    RAG_RELEVANCE_FLOOR = float(_ENV["RAG_RELEVANCE_FLOOR"]) if _ENV.get("RAG_RELEVANCE_FLOOR") else None
+    RAG_SOFT_DEADLINE_MS = 150  # Answer without verses rather than wait longer for retrieval
+    LOG_RAG_VERSES = _ENV.get("LOG_RAG_VERSES", "True").lower() == "true"  # Print retrieved verse references
+    
+    # Semantic response cache (embedding retriever only - needs the query encoder)
+    SEMANTIC_CACHE_SIZE = 1000
+    SEMANTIC_CACHE_THRESHOLD = 0.95  # Cosine similarity for reusing a previous answer
     
     @classmethod
     def validate(cls):
-        """Validate required API keys"""
+        """Validate required API keys (only checked once per process)"""
+        global _VALIDATED
+        if _VALIDATED:
+            return True
+        
         if not cls.OPENAI_API_KEY:
             raise ValueError("OPENAI_API_KEY is required in .env file")
         
         if cls.USE_GROQ and not cls.GROQ_API_KEY:
             raise ValueError("GROQ_API_KEY required when USE_GROQ=True")
         
+        _VALIDATED = True
         return True
 
 # Validate on import
@@ -2,10 +2,9 @@
 Simple HTTP Server to serve the client HTML
 """
 
+import functools
 import http.server
-import socketserver
 import os
-import threading
 
 PORT = 8000
 
@@ -17,17 +16,19 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
         super().end_headers()
 
-def start_http_server():
-    """Start HTTP server to serve client files"""
-    # Change to voice_ass directory
-    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+def start_http_server(ready=None):
+    """Start HTTP server to serve client files; sets the ready event once bound"""
+    # Serve from the voice_ass directory without chdir-ing the whole process
+    handler = functools.partial(MyHTTPRequestHandler, directory=os.path.dirname(os.path.abspath(__file__)))
     
-    # Allow reusing the address (prevents WinError 10048)
-    socketserver.TCPServer.allow_reuse_address = True
-    with socketserver.TCPServer(("", PORT), MyHTTPRequestHandler) as httpd:
+    # Threaded server so concurrent asset requests don't queue behind each other
+    # (ThreadingHTTPServer already sets allow_reuse_address, preventing WinError 10048)
+    with http.server.ThreadingHTTPServer(("", PORT), handler) as httpd:
         print(f"📡 HTTP Server running at http://localhost:{PORT}")
         print(f"🌐 Open http://localhost:{PORT}/client.html in your browser")
         print("="*60)
+        if ready:
+            ready.set()
         httpd.serve_forever()
 
 if __name__ == "__main__":
@@ -3,30 +3,59 @@ Intent Classification and Krishna Response Generation
 OPTIMIZED: Two-step approach for faster, accurate verse selection
 """
 
+import functools
+import re
 import time
-import json
+from collections import OrderedDict
+import orjson
 from openai import AsyncOpenAI
 from groq import AsyncGroq
 from config import Config
 
+# Matches the category field as soon as it is complete in a partial JSON stream
+_CATEGORY_RE = re.compile(r'"category"\s*:\s*"([^"]*)"')
+_WHITESPACE_RE = re.compile(r'\s+')
+
 class IntentClassifier:
     """Classifies user intent and generates Krishna's response"""
     
     def __init__(self):
         self.use_groq = Config.USE_GROQ
         
+        # Create both clients once so their connection pools are reused across requests
+        self._openai_client = AsyncOpenAI(api_key=Config.OPENAI_API_KEY)
+        self._groq_client = AsyncGroq(api_key=Config.GROQ_API_KEY) if self.use_groq else None
+        
         if self.use_groq:
-            self.client = AsyncGroq(api_key=Config.GROQ_API_KEY)
+            self.client = self._groq_client
             self.model = Config.GROQ_MODEL
         else:
-            self.client = AsyncOpenAI(api_key=Config.OPENAI_API_KEY)
+            self.client = self._openai_client
             self.model = Config.OPENAI_MODEL
         
         self.categories = Config.INTENT_CATEGORIES
         self.bhagavad_gita_verses = self._load_gita_wisdom()
+        
+        # Flatten verses and build the system prompt once - identical for every request
+        self.all_verses = [
+            {**v, "category": category}
+            for category, verses in self.bhagavad_gita_verses.items()
+            for v in verses
+        ]
+        self._system_prompt = self._build_system_prompt(self.all_verses[:8])
+        self._log_prompt_tokens()
+        
+        # Optional: pick the verse locally by embedding similarity so the prompt carries one verse
+        # (_verse_encoder is the shared embedding retriever, or None)
+        self._verse_encoder = self._init_verse_encoder()
+        
+        # TTL-bounded LRU of (normalized query, category_only) -> (stored_at, result)
+        self._response_cache = OrderedDict()
     
-    def _load_gita_wisdom(self) -> dict:
-        """Load comprehensive Bhagavad Gita verses - EXPANDED DATABASE"""
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _load_gita_wisdom() -> dict:
+        """Load comprehensive Bhagavad Gita verses - EXPANDED DATABASE (built once, shared read-only)"""
         return {
             "Career/Purpose": [
                 {
@@ -130,76 +159,198 @@ class IntentClassifier:
             ]
         }
     
-    async def classify_and_respond(self, user_query: str) -> dict:
+    def _log_prompt_tokens(self):
+        """Measure the static system prompt once at startup (tiktoken is optional)"""
+        try:
+            import tiktoken
+            encoding = tiktoken.encoding_for_model(Config.OPENAI_MODEL)
+        except Exception:
+            return  # Not installed, or encoding files unavailable offline
+        
+        tokens = len(encoding.encode(self._system_prompt))
+        print(f"📏 Intent system prompt: {tokens} tokens")
+        if tokens > Config.INTENT_PROMPT_TOKEN_BUDGET:
+            print(f"⚠️ Intent system prompt exceeds budget of {Config.INTENT_PROMPT_TOKEN_BUDGET} tokens")
+    
+    def _init_verse_encoder(self):
+        """
+        Embed every verse once for local top-1 selection
+        
+        Uses the embedding RAG retriever (its query encoder and embed_query batching),
+        so the model is loaded once per process. Skipped in lightweight mode or when
+        the embedding retriever is unavailable; the prompt then falls back to the
+        multi-verse database.
+        """
+        if Config.LIGHTWEIGHT_RAG:
+            return None
+        try:
+            from rag_retriever import get_retriever
+            retriever = get_retriever()
+        except Exception as e:
+            print(f"⚠️ Intent classifier: no shared verse encoder ({e})")
+            return None
+        if not hasattr(retriever, 'embed_query'):
+            return None  # Fell back to the keyword retriever
+        
+        self._verse_embs = retriever.model.encode(
+            [f"{v['translation']} {v['context']}" for v in self.all_verses],
+            normalize_embeddings=True,
+            convert_to_numpy=True
+        )
+        # One prebuilt prompt per verse - selection just indexes into this list
+        self._verse_prompts = [self._build_system_prompt([v]) for v in self.all_verses]
+        print(f"✅ Intent classifier: local verse selection over {len(self.all_verses)} verses")
+        return retriever
+    
+    async def _get_system_prompt(self, query: str) -> str:
+        """System prompt for this query - single best verse when local selection is available"""
+        if self._verse_encoder is None:
+            return self._system_prompt
+        # Cosine-similarity top-1 verse (embeddings are normalized)
+        q = await self._verse_encoder.embed_query(query)
+        return self._verse_prompts[int((self._verse_embs @ q).argmax())]
+    
+    def _build_system_prompt(self, verses: list) -> str:
+        """Build the combined intent + response prompt with the embedded verse database"""
+        verses_json = orjson.dumps(verses).decode()
+        categories = ", ".join(self.categories)
+        
+        return f"""You are Lord Krishna, divine guide from the Bhagavad Gita.
+
+VERSE DATABASE (use the most relevant):
+{verses_json}
+
+RULES:
+1. LANGUAGE: Match user's language (Hindi → Hindi, English → English)
+2. Select the MOST relevant verse for their situation
+3. Provide deep, practical guidance (4-6 sentences)
+4. Voice response should be natural for speech synthesis
+
+RESPOND IN JSON ONLY (category first):
+{{
+    "category": "One of: {categories}",
+    "response": "Your detailed written guidance...",
+    "selected_verse": {{"sanskrit": "...", "translation": "...", "reference": "..."}},
+    "voice_response": "Natural spoken version for TTS (2-3 sentences)..."
+}}"""
+    
+    async def classify_and_respond(self, user_query: str, category_only: bool = False) -> dict:
         """
         OPTIMIZED: Single LLM call for intent classification + response generation
         Combines both steps to reduce latency by ~200-300ms
+        
+        Args:
+            user_query: User's message
+            category_only: Return as soon as the category is streamed,
+                skipping the rest of the generated response
         """
         start_time = time.time()
         
+        # Repeat queries ("I feel lost") are answered from the cache
+        cache_key = self._cache_key(user_query, category_only)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return {**cached, "latency": time.time() - start_time, "cached": True}
+        
         # Use Groq if configured, fallback to OpenAI
         use_openai = not self.use_groq
         
         try:
-            result = await self._generate_combined_response(user_query, use_openai=use_openai)
+            result = await self._generate_combined_response(user_query, use_openai=use_openai, category_only=category_only)
+            self._cache_put(cache_key, result)
             result["latency"] = time.time() - start_time
             return result
             
         except Exception as e:
             if "rate_limit" in str(e).lower() or "429" in str(e):
                 print(f"⚠️ Groq Rate Limit hit! Falling back to OpenAI...")
-                return await self._generate_combined_response(user_query, use_openai=True)
+                return await self._generate_combined_response(user_query, use_openai=True, category_only=category_only)
             
             print(f"❌ Intent Error: {e}")
             return {"success": False, "response": "Dear seeker, I am with you.", "voice_response": "Dear seeker, I am with you."}
 
-    async def _generate_combined_response(self, query: str, use_openai: bool = False) -> dict:
-        """Single LLM call that handles both intent detection and response generation"""
-        
-        # Flatten all verses into a single reference
-        all_verses = []
-        for category, verses in self.bhagavad_gita_verses.items():
-            for v in verses:
-                all_verses.append({**v, "category": category})
+    def _cache_key(self, query: str, category_only: bool):
+        """Normalized cache key, or None for queries too short to cache safely"""
+        normalized = _WHITESPACE_RE.sub(' ', query.strip().lower())
+        if len(normalized) < 5:
+            return None
+        return (normalized, category_only)
+    
+    def _cache_get(self, key):
+        """Return a cached result if present and not expired"""
+        if key is None:
+            return None
+        entry = self._response_cache.get(key)
+        if entry is None:
+            return None
+        stored_at, result = entry
+        if time.time() - stored_at > Config.INTENT_CACHE_TTL:
+            del self._response_cache[key]
+            return None
+        self._response_cache.move_to_end(key)
+        return result
+    
+    def _cache_put(self, key, result: dict):
+        """Store a successful result, evicting the least recently used entry when full"""
+        if key is None or not result.get("success"):
+            return
+        self._response_cache[key] = (time.time(), dict(result))
+        self._response_cache.move_to_end(key)
+        if len(self._response_cache) > Config.INTENT_CACHE_SIZE:
+            self._response_cache.popitem(last=False)
+    
+    async def _generate_combined_response(self, query: str, use_openai: bool = False, category_only: bool = False) -> dict:
+        """Single streamed LLM call that handles both intent detection and response generation"""
         
-        # Build efficient prompt with embedded wisdom
+        # Pick provider (system prompts are prebuilt in __init__)
         if use_openai:
-            client = AsyncOpenAI(api_key=Config.OPENAI_API_KEY)
+            client = self._openai_client
             model = Config.OPENAI_MODEL
         else:
             client = self.client
             model = self.model
+        
+        system_prompt = await self._get_system_prompt(query)
 
-        system_prompt = f"""You are Lord Krishna, divine guide from the Bhagavad Gita.
-
-VERSE DATABASE (use the most relevant):
-{json.dumps(all_verses[:8], ensure_ascii=False)}
-
-RULES:
-1. LANGUAGE: Match user's language (Hindi → Hindi, English → English)
-2. Select the MOST relevant verse for their situation
-3. Provide deep, practical guidance (4-6 sentences)
-4. Voice response should be natural for speech synthesis
-
-RESPOND IN JSON ONLY:
-{{
-    "response": "Your detailed written guidance...",
-    "selected_verse": {{"sanskrit": "...", "translation": "...", "reference": "..."}},
-    "voice_response": "Natural spoken version for TTS (2-3 sentences)..."
-}}"""
-
-        completion = await client.chat.completions.create(
+        stream = await client.chat.completions.create(
             model=model,
             messages=[
                 {"role": "system", "content": system_prompt}, 
                 {"role": "user", "content": query}
             ],
             temperature=0.7,
-            max_tokens=600,  # Reduced for faster response
-            response_format={"type": "json_object"}
+            max_tokens=400,  # Reduced for faster response
+            response_format={"type": "json_object"},
+            stream=True
         )
         
-        data = json.loads(completion.choices[0].message.content)
+        # Accumulate the JSON as it streams; the category arrives in the first few tokens
+        content = ""
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                content += delta
+                
+                if category_only:
+                    match = _CATEGORY_RE.search(content)
+                    if match:
+                        return {"success": True, "category": match.group(1)}
+        finally:
+            await stream.close()
+        
+        data = orjson.loads(content)
         data["success"] = True
         return data
 
+
+# Singleton instance
+_classifier_instance = None
+
+def get_intent_classifier() -> IntentClassifier:
+    """Get or create singleton intent classifier instance"""
+    global _classifier_instance
+    if _classifier_instance is None:
+        _classifier_instance = IntentClassifier()
+    return _classifier_instance
@@ -1,23 +1,41 @@
 """
 Launch Script for Krishna Real-Time Voice Assistant
-Starts both WebSocket server and HTTP server
+Starts both WebSocket server and HTTP server in a single process
 """
 
 import asyncio
-import subprocess
-import sys
 import os
-from threading import Thread
+from threading import Event, Thread
 
-def start_http_server():
-    """Start HTTP server in separate process"""
+def start_http_server(ready):
+    """Start HTTP server (runs in a background thread)"""
     print("🌐 Starting HTTP server...")
-    subprocess.run([sys.executable, "http_server.py"])
+    from http_server import start_http_server as serve_http
+    serve_http(ready)
 
-def start_websocket_server():
-    """Start WebSocket server"""
+def start_websocket_server(on_ready):
+    """Start WebSocket server on this thread's event loop (blocking)"""
     print("🚀 Starting WebSocket server...")
-    subprocess.run([sys.executable, "streaming_server.py"])
+    from streaming_server import main as serve_websocket, use_uvloop
+    use_uvloop()
+    asyncio.run(serve_websocket(on_ready))
+
+def print_ready_banner():
+    """Printed only once both servers are accepting connections"""
+    print()
+    print("="*60)
+    print("🎉 SERVERS READY!")
+    print("="*60)
+    print("📡 WebSocket: ws://localhost:8765")
+    print("🌐 Web Client: http://localhost:8000/krishna_complete.html")
+    print("="*60)
+    print()
+    print("👉 Open http://localhost:8000/krishna_complete.html in your browser")
+    print("👉 Select your microphone and click START RECORDING")
+    print()
+    print("Press Ctrl+C to stop")
+    print("="*60)
+    print()
 
 def main():
     """Launch both servers"""
@@ -48,31 +66,19 @@ def main():
         print("✅ Configuration validated")
         print()
         
-        # Start HTTP server in background thread
-        http_thread = Thread(target=start_http_server, daemon=True)
+        # Start HTTP server in background thread (same process, shared config)
+        http_ready = Event()
+        http_thread = Thread(target=start_http_server, args=(http_ready,), daemon=True)
         http_thread.start()
         
-        # Give HTTP server time to start
-        import time
-        time.sleep(2)
-        
-        print()
-        print("="*60)
-        print("🎉 SERVERS READY!")
-        print("="*60)
-        print("📡 WebSocket: ws://localhost:8765")
-        print("🌐 Web Client: http://localhost:8000/krishna_complete.html")
-        print("="*60)
-        print()
-        print("👉 Open http://localhost:8000/krishna_complete.html in your browser")
-        print("👉 Select your microphone and click START RECORDING")
-        print()
-        print("Press Ctrl+C to stop")
-        print("="*60)
-        print()
+        # Wait for the HTTP socket to bind; if the thread died (e.g. port in use), stop here
+        while not http_ready.wait(0.1):
+            if not http_thread.is_alive():
+                print("❌ HTTP server failed to start")
+                return
         
-        # Start WebSocket server (blocking)
-        start_websocket_server()
+        # Start WebSocket server (blocking); banner prints once it is listening
+        start_websocket_server(print_ready_banner)
         
     except KeyboardInterrupt:
         print("\n\n👋 Shutting down servers...")
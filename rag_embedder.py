@@ -9,20 +9,115 @@ This will:
 1. Load all JSON files from data/ folder
 2. Create structured text chunks
 3. Generate embeddings using all-MiniLM-L6-v2
-4. Store in ChromaDB for fast retrieval
+4. Store as a flat int8 numpy matrix for exact inner-product retrieval
 
 Expected time: 2-5 minutes (one-time only)
 """
 
 import os
-import json
-from typing import List, Dict
+import sqlite3
+import ijson
+import orjson
+from collections import defaultdict
+from hashlib import blake2b
+from itertools import chain
+from typing import List, Dict, Iterator
+from pathlib import Path
+import numpy as np
 from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
 from config import Config
 
 
+def _build_chunks_for_verse(verse: Dict, lookups: tuple) -> List[Dict]:
+    """Build one chunk per translation of a single verse"""
+    chapter_dict, author_dict, lang_dict, trans_by_verse, comm_by_verse_author = lookups
+    
+    verse_id = verse.get('id')
+    chapter_id = verse.get('chapter_id')
+    verse_number = verse.get('verse_number')
+    
+    # Get chapter info
+    chapter_info = chapter_dict.get(chapter_id, {})
+    chapter_name = chapter_info.get('name', 'Unknown')
+    
+    # Base verse info
+    sanskrit_text = verse.get('text', '')
+    transliteration = verse.get('transliteration', '')
+    word_meanings = verse.get('word_meanings', '')
+    
+    # Get translations for this verse
+    verse_translations = trans_by_verse.get(verse_id)
+    if not verse_translations:
+        return []
+    
+    # Get commentaries for this verse, keyed by author
+    verse_commentaries = comm_by_verse_author.get(verse_id, {})
+    
+    # Verse-level text is identical for every translation chunk - build once
+    verse_header = (
+        f"Scripture: Bhagavad Gita\nChapter: {chapter_id} - {chapter_name}\nVerse: {verse_number}\n"
+        f"\nSanskrit Verse:\n{sanskrit_text}\n"
+        + (f"\nTransliteration:\n{transliteration}\n" if transliteration else "")
+        + (f"\nWord Meanings:\n{word_meanings}\n" if word_meanings else "")
+    )
+    
+    # Create chunk for primary (English) translation
+    chunks = []
+    for trans in verse_translations:
+        lang_id = trans.get('language_id')
+        lang_info = lang_dict.get(lang_id, {})
+        lang_name = lang_info.get('language', 'Unknown')
+        
+        author_id = trans.get('author_id')
+        author_info = author_dict.get(author_id, {})
+        author_name = author_info.get('name', 'Unknown')
+        
+        translation_text = trans.get('description', '')
+        
+        # Find matching commentary from same author
+        matching_commentary = verse_commentaries.get(author_id, "")
+        
+        # Build structured text (verse-level header is shared across translations)
+        translation_section = f"\nTranslation ({lang_name}):\n{translation_text}\n" if translation_text else ""
+        commentary_section = f"\nCommentary ({author_name}):\n{matching_commentary}\n" if matching_commentary else ""
+        chunk_text = f"{verse_header}{translation_section}{commentary_section}"
+        
+        # Prompt-ready text for retrieval results (commentary is embedded, not injected)
+        context_text = f"{verse_header}{translation_section}"
+        
+        # Create metadata
+        metadata = {
+            "chapter": chapter_id,
+            "verse": verse_number,
+            "chapter_name": chapter_name,
+            "language": lang_name,
+            "scripture": "Bhagavad Gita",
+            "type": "verse",
+            "has_word_meanings": bool(word_meanings),
+            "has_commentary": bool(matching_commentary),
+            "author": author_name,
+            "verse_id": str(verse_id)
+        }
+        
+        chunks.append({
+            "text": chunk_text,
+            "context": context_text,
+            "metadata": metadata,
+            "id": f"v{verse_id}_t{author_id}_{lang_id}"
+        })
+    
+    return chunks
+
+
+def quantize_int8(embeddings: np.ndarray) -> tuple:
+    """Symmetric per-row int8 quantization: returns (int8 matrix, float32 scales)"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    scales = np.abs(embeddings).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.rint(embeddings / scales[:, None]).astype(np.int8)
+    return np.ascontiguousarray(quantized), scales.astype(np.float32)
+
+
 class BhagavadGitaEmbedder:
     """One-time embedder for Gita verses"""
     
@@ -38,13 +133,34 @@ class BhagavadGitaEmbedder:
         # Load embedding model
         print(f"📥 Loading embedding model: {Config.EMBEDDING_MODEL}")
         print("   (First run will download ~80MB model)")
-        self.model = SentenceTransformer(Config.EMBEDDING_MODEL)
+        self.model = self._load_model()
         print("✅ Model loaded!")
         
-        # Initialize ChromaDB
-        print(f"\n📁 Initializing vector database at: {Config.VECTOR_DB_PATH}")
-        self.client = chromadb.PersistentClient(path=Config.VECTOR_DB_PATH)
+        # Flat vector store: embeddings matrix + chunk records side by side
+        self.store_dir = Path(Config.VECTOR_DB_PATH)
+        print(f"\n📁 Vector store location: {self.store_dir}")
+        
+    def _load_model(self) -> SentenceTransformer:
+        """
+        Load the embedding model on the fastest available backend
+        
+        ONNX Runtime is used when EMBEDDING_BACKEND=onnx (sentence-transformers >= 3.2),
+        otherwise PyTorch in FP16 on CUDA. CPU-only boxes keep FP32.
+        """
+        if Config.EMBEDDING_BACKEND == "onnx":
+            try:
+                model = SentenceTransformer(Config.EMBEDDING_MODEL, backend="onnx")
+                print("   ⚡ Using ONNX Runtime backend")
+                return model
+            except Exception as e:
+                print(f"⚠️ ONNX backend unavailable ({e}), falling back to PyTorch")
         
+        model = SentenceTransformer(Config.EMBEDDING_MODEL)
+        if model.device.type == "cuda":
+            model.half()
+            print("   ⚡ Using FP16 on CUDA")
+        return model
+    
     def load_json_file(self, filename: str) -> Dict:
         """Load and parse JSON file"""
         filepath = os.path.join(self.data_dir, filename)
@@ -53,8 +169,19 @@ class BhagavadGitaEmbedder:
             print(f"⚠️ Warning: {filename} not found at {filepath}")
             return {}
         
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(filepath, 'rb') as f:
+            return orjson.loads(f.read())
+    
+    def iter_json_file(self, filename: str) -> Iterator[Dict]:
+        """Stream records from a top-level JSON array without loading the whole file"""
+        filepath = os.path.join(self.data_dir, filename)
+        
+        if not os.path.exists(filepath):
+            print(f"⚠️ Warning: {filename} not found at {filepath}")
+            return
+        
+        with open(filepath, 'rb') as f:
+            yield from ijson.items(f, 'item')
     
     def create_verse_chunks(self) -> List[Dict]:
         """
@@ -65,10 +192,8 @@ class BhagavadGitaEmbedder:
         """
         print("\n📚 Loading JSON files...")
         
-        # Load all JSON files
+        # Load small JSON files (translations/commentaries are streamed below)
         verses = self.load_json_file("verse.json")
-        translations = self.load_json_file("translation.json")
-        commentaries = self.load_json_file("commentary.json")
         chapters = self.load_json_file("chapters.json")
         authors = self.load_json_file("authors.json")
         languages = self.load_json_file("languages.json")
@@ -86,188 +211,115 @@ class BhagavadGitaEmbedder:
         author_dict = {au.get('id'): au for au in authors} if authors else {}
         lang_dict = {la.get('id'): la for la in languages} if languages else {}
         
-        # Group translations and commentaries by verse_id
-        trans_by_verse = {}
-        for trans in translations:
-            verse_id = trans.get('verse_id')
-            if verse_id not in trans_by_verse:
-                trans_by_verse[verse_id] = []
-            trans_by_verse[verse_id].append(trans)
-        
-        comm_by_verse = {}
-        for comm in commentaries:
-            verse_id = comm.get('verse_id')
-            if verse_id not in comm_by_verse:
-                comm_by_verse[verse_id] = []
-            comm_by_verse[verse_id].append(comm)
-        
-        # Create chunks
+        # Stream-group translations by verse_id, commentaries by (verse_id, author_id)
+        trans_by_verse = defaultdict(list)
+        for trans in self.iter_json_file("translation.json"):
+            trans_by_verse[trans.get('verse_id')].append(trans)
+        
+        comm_by_verse_author = defaultdict(dict)
+        for comm in self.iter_json_file("commentary.json"):
+            # Keep the first commentary per author, as before
+            comm_by_verse_author[comm.get('verse_id')].setdefault(
+                comm.get('author_id'), comm.get('description', '')
+            )
+        
+        # Create chunks. Serial on purpose: building all ~4.9k chunks takes ~30ms, far
+        # less than pickling the commentary lookups to a process pool and the chunks back
         print("\n🔨 Creating structured text chunks...")
-        chunks = []
+        lookups = (chapter_dict, author_dict, lang_dict, trans_by_verse, comm_by_verse_author)
+        chunks = list(chain.from_iterable(_build_chunks_for_verse(verse, lookups) for verse in verses))
         
-        for verse in verses:
-            verse_id = verse.get('id')
-            chapter_id = verse.get('chapter_id')
-            verse_number = verse.get('verse_number')
-            
-            # Get chapter info
-            chapter_info = chapter_dict.get(chapter_id, {})
-            chapter_name = chapter_info.get('name', 'Unknown')
-            
-            # Base verse info
-            sanskrit_text = verse.get('text', '')
-            transliteration = verse.get('transliteration', '')
-            word_meanings = verse.get('word_meanings', '')
+        print(f"✅ Created {len(chunks)} text chunks")
+        return chunks
+    
+    def _encode_with_cache(self, texts: List[str]) -> np.ndarray:
+        """
+        Encode texts, reusing vectors from the on-disk embedding cache
+        
+        Cache rows are keyed by a blake2b hash of model name + chunk text,
+        so switching EMBEDDING_MODEL never returns stale vectors.
+        """
+        model_key = Config.EMBEDDING_MODEL.encode('utf-8') + b"\0"
+        hashes = [blake2b(model_key + t.encode('utf-8'), digest_size=16).digest() for t in texts]
+        
+        conn = sqlite3.connect(Config.EMBEDDING_CACHE_PATH)
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings (hash BLOB PRIMARY KEY, vec BLOB)")
             
-            # Get translations for this verse
-            verse_translations = trans_by_verse.get(verse_id, [])
+            cached = {}
+            for i in range(0, len(hashes), 500):  # Stay under SQLite's host-parameter limit
+                batch = hashes[i:i+500]
+                rows = conn.execute(
+                    f"SELECT hash, vec FROM embeddings WHERE hash IN ({','.join('?' * len(batch))})", batch
+                )
+                cached.update(rows)
             
-            # Get commentaries for this verse
-            verse_commentaries = comm_by_verse.get(verse_id, [])
+            missing = [i for i, h in enumerate(hashes) if h not in cached]
+            print(f"   💾 {len(texts) - len(missing)} cached, {len(missing)} to embed")
             
-            # Create chunk for primary (English) translation
-            for trans in verse_translations:
-                lang_id = trans.get('language_id')
-                lang_info = lang_dict.get(lang_id, {})
-                lang_name = lang_info.get('language', 'Unknown')
-                
-                author_id = trans.get('author_id')
-                author_info = author_dict.get(author_id, {})
-                author_name = author_info.get('name', 'Unknown')
-                
-                translation_text = trans.get('description', '')
-                
-                # Find matching commentary from same author
-                matching_commentary = ""
-                for comm in verse_commentaries:
-                    if comm.get('author_id') == author_id:
-                        matching_commentary = comm.get('description', '')
-                        break
-                
-                # Build structured text
-                text_parts = [
-                    "Scripture: Bhagavad Gita",
-                    f"Chapter: {chapter_id} - {chapter_name}",
-                    f"Verse: {verse_number}",
-                    "",
-                    "Sanskrit Verse:",
-                    sanskrit_text,
-                    ""
-                ]
-                
-                if transliteration:
-                    text_parts.extend([
-                        "Transliteration:",
-                        transliteration,
-                        ""
-                    ])
-                
-                if word_meanings:
-                    text_parts.extend([
-                        "Word Meanings:",
-                        word_meanings,
-                        ""
-                    ])
+            if missing:
+                print("   This may take 2-5 minutes...")
+                new_embeddings = self.model.encode(
+                    [texts[i] for i in missing],
+                    batch_size=64,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True,  # Unit vectors: cosine == dot product
+                    show_progress_bar=True
+                ).astype(np.float32)
                 
-                if translation_text:
-                    text_parts.extend([
-                        f"Translation ({lang_name}):",
-                        translation_text,
-                        ""
-                    ])
-                
-                if matching_commentary:
-                    text_parts.extend([
-                        f"Commentary ({author_name}):",
-                        matching_commentary,
-                        ""
-                    ])
-                
-                chunk_text = "\n".join(text_parts)
-                
-                # Create metadata
-                metadata = {
-                    "chapter": chapter_id,
-                    "verse": verse_number,
-                    "chapter_name": chapter_name,
-                    "language": lang_name,
-                    "scripture": "Bhagavad Gita",
-                    "type": "verse",
-                    "has_word_meanings": bool(word_meanings),
-                    "has_commentary": bool(matching_commentary),
-                    "author": author_name,
-                    "verse_id": str(verse_id)
-                }
-                
-                chunks.append({
-                    "text": chunk_text,
-                    "metadata": metadata,
-                    "id": f"v{verse_id}_t{author_id}_{lang_id}"
-                })
+                rows = [(hashes[i], vec.tobytes()) for i, vec in zip(missing, new_embeddings)]
+                conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?)", rows)
+                conn.commit()
+                cached.update(rows)
+        finally:
+            conn.close()
         
-        print(f"✅ Created {len(chunks)} text chunks")
-        return chunks
+        return np.stack([np.frombuffer(cached[h], dtype=np.float32) for h in hashes])
     
     def embed_and_store(self, chunks: List[Dict]):
         """
-        Generate embeddings and store in ChromaDB
+        Generate embeddings and store them as a flat numpy vector store
+        
+        Writes embeddings.npy (int8, row i == chunk i), scales.npy (float32
+        per-row dequantization scale) and chunks.json (id, context text,
+        metadata) under VECTOR_DB_PATH. Rows are L2-normalized before
+        symmetric int8 quantization, so row * scale approximates the unit vector.
+        A few thousand chunks fit an exact inner-product scan in <1ms,
+        so no ANN index or database is needed.
         
         Args:
-            chunks: List of chunk dicts with 'text', 'metadata', 'id'
+            chunks: List of chunk dicts with 'text', 'context', 'metadata', 'id'
         """
-        # Check if collection already exists
-        try:
-            existing_collection = self.client.get_collection(name=Config.COLLECTION_NAME)
-            print(f"\n⚠️ Collection '{Config.COLLECTION_NAME}' already exists!")
+        embeddings_path = self.store_dir / "embeddings.npy"
+        scales_path = self.store_dir / "scales.npy"
+        chunks_path = self.store_dir / "chunks.json"
+        
+        # Check if store already exists
+        if embeddings_path.exists():
+            print(f"\n⚠️ Vector store at '{self.store_dir}' already exists!")
             
             response = input("   Delete and recreate? (yes/no): ").strip().lower()
-            if response == 'yes':
-                self.client.delete_collection(name=Config.COLLECTION_NAME)
-                print("   ✅ Deleted existing collection")
-            else:
+            if response != 'yes':
                 print("   ❌ Aborted. Using existing embeddings.")
                 return
-        except:
-            pass  # Collection doesn't exist, continue
-        
-        # Create collection
-        print(f"\n🔧 Creating collection: {Config.COLLECTION_NAME}")
-        collection = self.client.create_collection(
-            name=Config.COLLECTION_NAME,
-            metadata={"description": "Bhagavad Gita verses with translations and commentary"}
-        )
         
-        # Batch embedding for efficiency
+        # Reuse cached vectors; only new/changed chunk texts hit the model
         print(f"\n⚡ Generating embeddings for {len(chunks)} chunks...")
-        print("   This may take 2-5 minutes...")
+        embeddings = self._encode_with_cache([chunk['text'] for chunk in chunks])
         
-        batch_size = 50  # Process in batches
-        total_batches = (len(chunks) + batch_size - 1) // batch_size
-        
-        for i in range(0, len(chunks), batch_size):
-            batch = chunks[i:i+batch_size]
-            batch_num = i // batch_size + 1
-            
-            print(f"   Processing batch {batch_num}/{total_batches}...")
-            
-            # Extract data
-            texts = [chunk['text'] for chunk in batch]
-            metadatas = [chunk['metadata'] for chunk in batch]
-            ids = [chunk['id'] for chunk in batch]
-            
-            # Generate embeddings
-            embeddings = self.model.encode(texts, convert_to_tensor=False, show_progress_bar=False)
-            
-            # Store in ChromaDB
-            collection.add(
-                documents=texts,
-                embeddings=embeddings.tolist(),
-                metadatas=metadatas,
-                ids=ids
-            )
+        # Store as one contiguous int8 matrix (4x smaller than float32) + parallel records
+        embeddings, scales = quantize_int8(embeddings)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        np.save(embeddings_path, embeddings)
+        np.save(scales_path, scales)
+        records = [
+            {"id": chunk['id'], "context": chunk['context'], "metadata": chunk['metadata']}
+            for chunk in chunks
+        ]
+        chunks_path.write_bytes(orjson.dumps(records))
         
         print(f"\n✅ Successfully embedded and stored {len(chunks)} chunks!")
-        print(f"   Vector database saved at: {Config.VECTOR_DB_PATH}")
+        print(f"   Vector store saved at: {self.store_dir}")
     
     def run(self):
         """Main embedding pipeline"""
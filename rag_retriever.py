@@ -1,13 +1,119 @@
 """
 RAG Retriever - LIGHTWEIGHT VERSION for Render Free Tier
-Uses keyword-based search instead of embeddings to stay under 512MB
+Uses keyword-based search instead of embeddings to stay under 512MB.
+With LIGHTWEIGHT_RAG=false, searches the rag_embedder.py vector store instead.
 """
 
 import asyncio
+import ctypes
 import json
 import os
+import pickle
+import re
+import sys
+import threading
+from itertools import chain
 from typing import List, Dict, Optional
 from pathlib import Path
+import numpy as np
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+try:
+    import ijson  # optional: streams the data files instead of loading them whole
+except ImportError:
+    ijson = None
+
+try:
+    import ahocorasick  # optional: single-pass substring matching of concept triggers
+except ImportError:
+    ahocorasick = None
+
+# Stream-parse data files (low peak memory) or parse them whole with orjson (faster startup)
+STREAM_JSON = os.environ.get('STREAM_JSON', 'true').lower() == 'true'
+
+
+def _popcount(bits: np.ndarray) -> np.ndarray:
+    """Per-element popcount of a uint64 array (SIMD ufunc on NumPy >= 2.0)"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits)
+    return np.unpackbits(bits.view(np.uint8), axis=-1).reshape(*bits.shape, 64).sum(axis=-1)
+
+
+# Query words that pull in related Gita concepts
+_CONCEPT_MAP = {
+    'failure': {'duty', 'dharma', 'action', 'despair', 'arjuna'},
+    'fail': {'duty', 'dharma', 'action'},
+    'anxiety': {'fear', 'mind', 'peace', 'control', 'steady'},
+    'fear': {'courage', 'fearless', 'warrior', 'death'},
+    'stress': {'mind', 'peace', 'equanimity', 'calm'},
+    'depression': {'despair', 'grief', 'sorrow', 'arise'},
+    'sad': {'grief', 'sorrow', 'tears'},
+    'angry': {'anger', 'desire', 'control', 'lust'},
+    'death': {'soul', 'eternal', 'immortal', 'body', 'atman'},
+    'purpose': {'dharma', 'duty', 'action', 'calling'},
+    'confused': {'doubt', 'confusion', 'arjuna', 'clarity'},
+    'lost': {'path', 'guidance', 'dharma', 'direction'},
+    'work': {'karma', 'action', 'duty', 'fruit', 'result'},
+    'career': {'dharma', 'duty', 'work', 'action'},
+    'relationship': {'attachment', 'love', 'duty', 'compassion'},
+    'meditation': {'yoga', 'mind', 'focus', 'concentration'},
+    'peace': {'equanimity', 'calm', 'tranquil', 'steady'},
+    'happiness': {'joy', 'bliss', 'contentment', 'pleasure'},
+}
+
+
+def _build_trigger_automaton():
+    """Compile the concept triggers into one Aho-Corasick automaton (None without pyahocorasick)"""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for term in _CONCEPT_MAP:
+        automaton.add_word(term, term)
+    automaton.make_automaton()
+    return automaton
+
+
+_CONCEPT_AUTOMATON = _build_trigger_automaton()
+
+# Keywords: lowercase ASCII alphanumeric runs of 3+ chars
+_TOKEN_RE = re.compile(r"[a-z0-9]{3,}")
+
+
+def _iter_records(path: Path):
+    """Yield the records of a top-level JSON array (streamed if STREAM_JSON and ijson is available)"""
+    if not path.exists():
+        return
+    if STREAM_JSON and ijson is not None:
+        with open(path, 'rb') as f:
+            yield from ijson.items(f, 'item')
+    else:
+        yield from _loads(path.read_bytes())
+
+
+def _mlock(array: np.ndarray):
+    """Best-effort pin an array's pages in RAM (Linux; ignored if RLIMIT_MEMLOCK is too low)"""
+    if not sys.platform.startswith('linux') or array.nbytes == 0:
+        return
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.mlock(ctypes.c_void_p(array.ctypes.data), ctypes.c_size_t(array.nbytes))
+    except (OSError, AttributeError):
+        pass
+
+
+# Concurrent query encodes arriving within this window share one model.encode call;
+# a full batch flushes immediately
+_EMBED_BATCH_WINDOW = 0.005
+_EMBED_MAX_BATCH = 8
+
+_DATA_DIR = Path(__file__).parent / "data"
+_INDEX_CACHE_PATH = _DATA_DIR / ".index.pkl"
+_INDEX_FORMAT = 2  # bump when the cached index layout changes
 
 
 class LightweightRetriever:
@@ -20,116 +126,157 @@ class LightweightRetriever:
         """Initialize with keyword index from data files"""
         print("🔍 Initializing Lightweight RAG Retriever...")
         
-        self.verses = []
-        self._load_verses()
+        # Structure-of-arrays verse store (row i == verse i)
+        self.chapters = np.zeros(0, dtype=np.int16)
+        self.verse_numbers = np.zeros(0, dtype=np.int16)
+        self.texts = np.empty(0, dtype=object)
         
-        print(f"✅ Loaded {len(self.verses)} verses (keyword-based, no ML model)")
-    
-    def _load_verses(self):
-        """Load verses from data files"""
-        data_dir = Path(__file__).parent / "data"
+        self.vocab = {}                                 # keyword -> bit index
+        self.bits = np.zeros((0, 1), dtype=np.uint64)   # (n_verses, ceil(vocab/64)) keyword bit matrix
+        if not self._load_index_cache():
+            self._load_verses()
+            self._save_index_cache()
         
-        # Load translations
-        translation_file = data_dir / "translation.json"
-        verse_file = data_dir / "verse.json"
+        # (chapter, verse) -> text for O(1) reference lookups
+        self._by_ref = {
+            (int(chapter), int(verse)): text
+            for chapter, verse, text in zip(self.chapters, self.verse_numbers, self.texts)
+        }
         
-        translations = {}
-        verses = {}
+        # Concept map compiled once against the vocabulary: trigger word -> bit-row
+        self.concept_masks = {
+            term: mask for term, concepts in _CONCEPT_MAP.items()
+            if (mask := self._keywords_to_mask(concepts)) is not None
+        }
         
+        print(f"✅ Loaded {len(self.texts)} verses (keyword-based, no ML model)")
+    
+    @staticmethod
+    def _index_cache_key() -> tuple:
+        """Identify the source data, tokenizer and NumPy the cached index was built with"""
+        key = [_INDEX_FORMAT, _TOKEN_RE.pattern, np.__version__]
+        for name in ("verse.json", "translation.json"):
+            st = (_DATA_DIR / name).stat()
+            key.append((st.st_mtime_ns, st.st_size))
+        return tuple(key)
+    
+    def _load_index_cache(self) -> bool:
+        """Restore the built index from disk if it matches the current data files"""
         try:
-            if translation_file.exists():
-                with open(translation_file, 'r', encoding='utf-8') as f:
-                    translations = json.load(f)
+            with _INDEX_CACHE_PATH.open('rb') as f:
+                key, index = pickle.load(f)
+            if key != self._index_cache_key():
+                return False
+            self.chapters, self.verse_numbers, self.texts, self.vocab, self.bits = index
+        except FileNotFoundError:
+            return False  # Cold start - nothing cached yet
+        except Exception as e:
+            # Any unreadable cache (truncated, other NumPy, old layout) just means a rebuild
+            print(f"⚠️ Ignoring verse index cache: {e!r}")
+            return False
+        return True
+    
+    def _save_index_cache(self):
+        """Persist the built index so warm starts skip parsing and tokenizing"""
+        if len(self.texts) == 0:
+            return
+        try:
+            index = (self.chapters, self.verse_numbers, self.texts, self.vocab, self.bits)
+            tmp = _INDEX_CACHE_PATH.with_suffix(f".{os.getpid()}.tmp")
+            with tmp.open('wb') as f:
+                pickle.dump((self._index_cache_key(), index), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, _INDEX_CACHE_PATH)  # Atomic - other workers never read a half-written file
+        except OSError:
+            pass  # Read-only filesystem - just skip caching
+    
+    def _load_verses(self):
+        """Load verses from data files and build the keyword bitmask index"""
+        try:
+            # Only (id, chapter, verse) per verse is kept while the translations stream past
+            verse_refs = [
+                (verse.get('id'), int(verse.get('chapter_number')), int(verse.get('verse_number')))
+                for verse in _iter_records(_DATA_DIR / "verse.json")
+            ]
             
-            if verse_file.exists():
-                with open(verse_file, 'r', encoding='utf-8') as f:
-                    verses = json.load(f)
+            # First English translation per verse (keywords and concept map are English)
+            english_by_verse = {}
+            for trans in _iter_records(_DATA_DIR / "translation.json"):
+                if trans.get('lang') == 'english':
+                    english_by_verse.setdefault(trans.get('verse_id'), trans.get('description', '').strip())
             
             # Build searchable index
-            for key, translation in translations.items():
-                # Parse key format "chapter.verse"
-                parts = key.split('.')
-                if len(parts) >= 2:
-                    chapter = parts[0]
-                    verse = parts[1]
-                    
-                    sanskrit = verses.get(key, {}).get('text', '')
-                    transliteration = verses.get(key, {}).get('transliteration', '')
-                    
-                    # Get first author's translation
-                    if isinstance(translation, dict):
-                        text = list(translation.values())[0] if translation else ''
-                    else:
-                        text = str(translation)
-                    
-                    self.verses.append({
-                        'chapter': int(chapter),
-                        'verse': int(verse),
-                        'text': text,
-                        'sanskrit': sanskrit,
-                        'transliteration': transliteration,
-                        'keywords': self._extract_keywords(text)
-                    })
+            chapters, verse_numbers, texts, keyword_sets = [], [], [], []
+            for verse_id, chapter, verse_number in verse_refs:
+                text = english_by_verse.pop(verse_id, '')
+                if not text:
+                    continue
+                
+                chapters.append(chapter)
+                verse_numbers.append(verse_number)
+                texts.append(text)
+                keyword_sets.append(self._extract_keywords(text))
+            
+            self.chapters = np.array(chapters, dtype=np.int16)
+            self.verse_numbers = np.array(verse_numbers, dtype=np.int16)
+            self.texts = np.empty(len(texts), dtype=object)
+            self.texts[:] = texts
+            
+            # Token -> bit index vocabulary, then one uint64 bit-row per verse
+            for keywords in keyword_sets:
+                for word in keywords:
+                    self.vocab.setdefault(word, len(self.vocab))
+            
+            rows, cols = [], []
+            for i, keywords in enumerate(keyword_sets):
+                for word in keywords:
+                    rows.append(i)
+                    cols.append(self.vocab[word])
+            rows = np.array(rows, dtype=np.intp)
+            cols = np.array(cols, dtype=np.uint64)
+            
+            self.bits = np.zeros((len(keyword_sets), (len(self.vocab) + 63) // 64), dtype=np.uint64)
+            np.bitwise_or.at(self.bits, (rows, (cols >> np.uint64(6)).astype(np.intp)), np.uint64(1) << (cols & np.uint64(63)))
                     
         except Exception as e:
             print(f"⚠️ Error loading verses: {e}")
     
+    def _keywords_to_mask(self, keywords: set) -> Optional[np.ndarray]:
+        """Pack keywords into a uint64 bit-row over the vocabulary (None if no word is known)"""
+        mask = np.zeros(self.bits.shape[1], dtype=np.uint64)
+        found = False
+        for word in keywords:
+            bit = self.vocab.get(word)
+            if bit is not None:
+                mask[bit >> 6] |= np.uint64(1 << (bit & 63))
+                found = True
+        return mask if found else None
+    
     def _extract_keywords(self, text: str) -> set:
-        """Extract lowercase keywords from text"""
+        """Extract lowercase keywords from text (one C-level regex scan, see _TOKEN_RE)"""
         if not text:
             return set()
-        
-        # Simple word extraction
-        words = text.lower().split()
-        # Remove punctuation
-        clean_words = set()
-        for word in words:
-            clean = ''.join(c for c in word if c.isalnum())
-            if len(clean) > 2:  # Skip very short words
-                clean_words.add(clean)
-        
-        return clean_words
+        return set(_TOKEN_RE.findall(text.lower()))
     
-    def _get_gita_keywords(self, query: str) -> set:
-        """Map query terms to Gita concepts"""
-        query_lower = query.lower()
+    def _get_gita_keywords(self, query: str) -> Optional[np.ndarray]:
+        """Map query terms to Gita concepts, returned as a query bit-row"""
+        query_words = self._extract_keywords(query)
+        query_mask = self._keywords_to_mask(query_words)
         
-        concept_map = {
-            'failure': {'duty', 'dharma', 'action', 'despair', 'arjuna'},
-            'fail': {'duty', 'dharma', 'action'},
-            'anxiety': {'fear', 'mind', 'peace', 'control', 'steady'},
-            'fear': {'courage', 'fearless', 'warrior', 'death'},
-            'stress': {'mind', 'peace', 'equanimity', 'calm'},
-            'depression': {'despair', 'grief', 'sorrow', 'arise'},
-            'sad': {'grief', 'sorrow', 'tears'},
-            'angry': {'anger', 'desire', 'control', 'lust'},
-            'death': {'soul', 'eternal', 'immortal', 'body', 'atman'},
-            'purpose': {'dharma', 'duty', 'action', 'calling'},
-            'confused': {'doubt', 'confusion', 'arjuna', 'clarity'},
-            'lost': {'path', 'guidance', 'dharma', 'direction'},
-            'work': {'karma', 'action', 'duty', 'fruit', 'result'},
-            'career': {'dharma', 'duty', 'work', 'action'},
-            'relationship': {'attachment', 'love', 'duty', 'compassion'},
-            'meditation': {'yoga', 'mind', 'focus', 'concentration'},
-            'peace': {'equanimity', 'calm', 'tranquil', 'steady'},
-            'happiness': {'joy', 'bliss', 'contentment', 'pleasure'},
-        }
-        
-        keywords = set()
-        
-        # Add original query words
-        words = query_lower.split()
-        for word in words:
-            clean = ''.join(c for c in word if c.isalnum())
-            if len(clean) > 2:
-                keywords.add(clean)
+        # Triggers found anywhere in the query (so "failed" fires "fail", "stressed"
+        # fires "stress"); pyahocorasick only makes that one pass instead of 18
+        query_lower = query.lower()
+        if _CONCEPT_AUTOMATON is not None:
+            triggers = {term for _, term in _CONCEPT_AUTOMATON.iter(query_lower)}
+        else:
+            triggers = [term for term in _CONCEPT_MAP if term in query_lower]
         
-        # Add mapped Gita concepts
-        for term, concepts in concept_map.items():
-            if term in query_lower:
-                keywords.update(concepts)
+        # OR in the precompiled concept masks for the triggers
+        for word in triggers:
+            concept_mask = self.concept_masks.get(word)
+            if concept_mask is not None:
+                query_mask = concept_mask if query_mask is None else query_mask | concept_mask
         
-        return keywords
+        return query_mask
     
     async def retrieve_context(self, query: str, top_k: int = 3) -> str:
         """
@@ -142,41 +289,241 @@ class LightweightRetriever:
         Returns:
             Formatted context string
         """
-        if not self.verses:
+        # Scoring is CPU-bound (NumPy releases the GIL) - keep it off the event loop
+        return await asyncio.to_thread(self._score, query, top_k)
+    
+    def _score(self, query: str, top_k: int) -> str:
+        """Score all verses against the query and format the top_k as context"""
+        if len(self.texts) == 0:
             return ""
         
         try:
-            # Get query keywords
-            query_keywords = self._get_gita_keywords(query)
+            # Get query keywords as a bitmask
+            query_mask = self._get_gita_keywords(query)
             
-            if not query_keywords:
+            if query_mask is None:
                 return ""
             
-            # Score each verse by keyword matches
-            scored_verses = []
-            for verse in self.verses:
-                score = len(query_keywords & verse['keywords'])
-                if score > 0:
-                    scored_verses.append((score, verse))
+            # Score every verse at once: AND with the query row, popcount, sum per verse
+            scores = _popcount(self.bits & query_mask).sum(axis=1, dtype=np.int32)
             
-            # Sort by score and get top_k
-            scored_verses.sort(key=lambda x: x[0], reverse=True)
-            top_verses = scored_verses[:top_k]
+            # Top_k by score, ties broken by verse order. A stable full sort of ~700
+            # ints is microseconds, and argpartition would pick arbitrary tied verses
+            top = np.argsort(-scores, kind='stable')[:top_k]
+            top = top[scores[top] > 0]
             
-            if not top_verses:
+            if len(top) == 0:
                 return ""
             
             # Format context
-            context_parts = ["=== RELEVANT SCRIPTURE CONTEXT ===\n"]
+            return "\n".join(chain(
+                ("=== RELEVANT SCRIPTURE CONTEXT ===\n",),
+                (f"\n[Verse {i}: Chapter {chapter}, Verse {verse}]\n{text}\n"
+                 for i, (chapter, verse, text) in enumerate(
+                     zip(self.chapters[top], self.verse_numbers[top], self.texts[top]), 1)),
+                ("=== END CONTEXT ===",),
+            ))
+            
+        except Exception as e:
+            print(f"⚠️ Retrieval error: {e}")
+            return ""
+    
+    def get_verse_by_reference(self, chapter: int, verse: int) -> Optional[str]:
+        """Get specific verse by reference"""
+        return self._by_ref.get((chapter, verse))
+
+
+class EmbeddingRetriever:
+    """
+    Dense retriever over the flat vector store written by rag_embedder.py.
+    Exact top-k via a single inner-product scan over int8 rows (dequantized
+    by per-row scale; embeddings are normalized).
+    Needs sentence-transformers and >512MB RAM.
+    """
+    
+    def __init__(self):
+        """Load the embedding matrix, chunk records and query encoder"""
+        from config import Config
+        
+        print("🔍 Initializing Embedding RAG Retriever...")
+        
+        store_dir = Path(Config.VECTOR_DB_PATH)
+        # Memory-mapped read-only: pages come from the page cache and are shared across processes
+        self.embeddings = np.load(store_dir / "embeddings.npy", mmap_mode='r')
+        _mlock(self.embeddings)
+        # int8 stores carry a per-row dequantization scale; float32 stores have none
+        scales_path = store_dir / "scales.npy"
+        self.scales = np.load(scales_path) if scales_path.exists() else None
+        self.chunks = _loads((store_dir / "chunks.json").read_bytes())
+        
+        self.model = self._load_query_model()
+        self.threshold = Config.RAG_SIMILARITY_THRESHOLD
+        
+        self._init_relevance_gate()
+        
+        # (chapter, verse) -> context of the first chunk for that verse
+        self._by_ref = {}
+        for chunk in self.chunks:
+            meta = chunk['metadata']
+            self._by_ref.setdefault((meta['chapter'], meta['verse']), chunk['context'])
+        
+        # Micro-batch queue: (query, future) pairs waiting for the next flush
+        self._pending = []
+        self._flush_timer = None
+        self._flush_tasks = set()
+        
+        print(f"✅ Loaded {len(self.chunks)} embedded chunks")
+    
+    def _init_relevance_gate(self):
+        """
+        Corpus centroid for the optional off-topic gate (Config.RAG_RELEVANCE_FLOOR)
+        
+        Off by default. Short questions sit much further from the centroid than the
+        long, homogeneous chunks do, so the floor has to be calibrated on real on- and
+        off-topic queries - and the scan it saves is one small matmul anyway.
+        """
+        from config import Config
+        
+        self._relevance_floor = Config.RAG_RELEVANCE_FLOOR
+        self._centroid = None
+        if self._relevance_floor is None:
+            return
+        vectors = np.asarray(self.embeddings, dtype=np.float32)
+        if self.scales is not None:
+            vectors = vectors * self.scales[:, None]
+        centroid = vectors.mean(axis=0)
+        norm = np.linalg.norm(centroid)
+        self._centroid = centroid / norm if norm > 0 else centroid
+    
+    @staticmethod
+    def _load_query_model():
+        """
+        Load the query encoder
+        
+        With EMBEDDING_BACKEND=onnx this is the dynamically INT8-quantized ONNX export
+        (EMBEDDING_ONNX_FILE) on ONNX Runtime; otherwise the PyTorch FP32 model.
+        """
+        from sentence_transformers import SentenceTransformer
+        from config import Config
+        
+        if Config.EMBEDDING_BACKEND == "onnx":
+            try:
+                model = SentenceTransformer(
+                    Config.EMBEDDING_MODEL,
+                    backend="onnx",
+                    model_kwargs={"file_name": Config.EMBEDDING_ONNX_FILE, "provider": "CPUExecutionProvider"},
+                )
+                print(f"   ⚡ Using INT8 ONNX query encoder ({Config.EMBEDDING_ONNX_FILE})")
+                return model
+            except Exception as e:
+                print(f"⚠️ ONNX query encoder unavailable ({e}), falling back to PyTorch")
+        
+        return SentenceTransformer(Config.EMBEDDING_MODEL)
+    
+    async def embed_query(self, query: str) -> np.ndarray:
+        """Encode a query, coalescing with other queries that arrive in the same window"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, future))
+        
+        if len(self._pending) >= _EMBED_MAX_BATCH:
+            # Batch is full - don't wait out the rest of the window
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+            self._schedule_flush()
+        elif len(self._pending) == 1:
+            self._flush_timer = loop.call_later(_EMBED_BATCH_WINDOW, self._schedule_flush)
+        return await future
+    
+    def _schedule_flush(self):
+        """Start a flush task (kept referenced until done)"""
+        self._flush_timer = None
+        task = asyncio.get_running_loop().create_task(self._flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+    
+    async def _flush(self):
+        """Encode every pending query in one batched call and resolve their futures"""
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            # Model inference is CPU-bound - keep it off the event loop
+            vectors = await asyncio.to_thread(
+                self.model.encode,
+                [query for query, _ in batch],
+                batch_size=_EMBED_MAX_BATCH,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+    
+    def _search(self, q: np.ndarray, top_k: int) -> List[Dict]:
+        """Top-k chunks by cosine similarity to the query vector, one per verse"""
+        scores = self.embeddings @ q
+        if self.scales is not None:
+            scores *= self.scales
+        
+        # Several translations share a verse - over-fetch, then dedupe by verse
+        k = min(top_k * 4, len(scores))
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        
+        results = []
+        seen_verses = set()
+        for idx in candidates:
+            if scores[idx] < self.threshold:
+                break
+            chunk = self.chunks[idx]
+            verse_id = chunk['metadata']['verse_id']
+            if verse_id in seen_verses:
+                continue
+            seen_verses.add(verse_id)
+            results.append(chunk)
+            if len(results) == top_k:
+                break
+        return results
+    
+    async def retrieve_context(self, query: str, top_k: int = 3) -> str:
+        """
+        Retrieve relevant verses by embedding similarity
+        
+        Args:
+            query: User's question
+            top_k: Number of verses to return
             
-            for i, (score, verse) in enumerate(top_verses, 1):
-                context_parts.append(f"\n[Verse {i}: Chapter {verse['chapter']}, Verse {verse['verse']}]")
-                context_parts.append(verse['text'])
-                context_parts.append("")
+        Returns:
+            Formatted context string
+        """
+        try:
+            q = await self.embed_query(query)
             
-            context_parts.append("=== END CONTEXT ===")
+            # Off-topic query (opt-in gate) - skip the scan, visibly
+            if self._centroid is not None:
+                similarity = float(q @ self._centroid)
+                if similarity < self._relevance_floor:
+                    print(f"🚫 RAG relevance gate: similarity {similarity:.3f} < {self._relevance_floor}, no verses")
+                    return ""
             
-            return "\n".join(context_parts)
+            top_chunks = await asyncio.to_thread(self._search, q, top_k)
+            
+            if not top_chunks:
+                return ""
+            
+            return "\n".join(chain(
+                ("=== RELEVANT SCRIPTURE CONTEXT ===\n",),
+                (f"\n[Verse {i}: Chapter {chunk['metadata']['chapter']}, Verse {chunk['metadata']['verse']}]\n{chunk['context']}"
+                 for i, chunk in enumerate(top_chunks, 1)),
+                ("=== END CONTEXT ===",),
+            ))
             
         except Exception as e:
             print(f"⚠️ Retrieval error: {e}")
@@ -184,34 +531,32 @@ class LightweightRetriever:
     
     def get_verse_by_reference(self, chapter: int, verse: int) -> Optional[str]:
         """Get specific verse by reference"""
-        for v in self.verses:
-            if v['chapter'] == chapter and v['verse'] == verse:
-                return v['text']
-        return None
+        return self._by_ref.get((chapter, verse))
 
 
 # MEMORY-EFFICIENT: Check if we should use lightweight or full retriever
 _retriever_instance = None
+_retriever_lock = threading.Lock()  # KrishnaLLM builds the retriever in a worker thread
 
 def get_retriever():
     """Get retriever instance - uses lightweight version for low memory environments"""
     global _retriever_instance
     
-    if _retriever_instance is None:
-        # Check if we're in a memory-constrained environment
-        use_lightweight = os.environ.get('LIGHTWEIGHT_RAG', 'true').lower() == 'true'
-        
-        if use_lightweight:
-            print("💡 Using Lightweight RAG (keyword-based, low memory)")
-            _retriever_instance = LightweightRetriever()
-        else:
-            # Import heavy version only if needed
-            from sentence_transformers import SentenceTransformer
-            import chromadb
+    with _retriever_lock:
+        if _retriever_instance is None:
+            # Check if we're in a memory-constrained environment
+            use_lightweight = os.environ.get('LIGHTWEIGHT_RAG', 'true').lower() == 'true'
             
-            # Full RAG implementation would go here
-            # But for Render free tier, we use lightweight
-            _retriever_instance = LightweightRetriever()
+            if use_lightweight:
+                print("💡 Using Lightweight RAG (keyword-based, low memory)")
+                _retriever_instance = LightweightRetriever()
+            else:
+                # Heavy version needs sentence-transformers + the rag_embedder.py output
+                try:
+                    _retriever_instance = EmbeddingRetriever()
+                except Exception as e:
+                    print(f"⚠️ Embedding RAG unavailable ({e}), using Lightweight RAG")
+                    _retriever_instance = LightweightRetriever()
     
     return _retriever_instance
 
@@ -4,42 +4,24 @@ Uses OpenAI to evaluate if Krishna's responses are relevant and helpful
 """
 
 import asyncio
+from typing import List
+import httpx
 from openai import AsyncOpenAI
 from config import Config
-import json
+import orjson
 
-class ResponseEvaluator:
-    """Evaluates response quality using OpenAI"""
-    
-    def __init__(self):
-        self.client = AsyncOpenAI(api_key=Config.OPENAI_API_KEY)
-        self.model = "gpt-4o-mini"  # Fast and cheap for evaluation
-        print("✅ Response Evaluator initialized (OpenAI)")
-    
-    async def evaluate(self, user_query: str, krishna_response: str, rag_context: str = "") -> dict:
-        """
-        Evaluate Krishna's response quality
-        
-        Returns:
-            dict with scores and feedback:
-            - relevance_score: 1-10 (Does response address user's question?)
-            - accuracy_score: 1-10 (Are Gita verses used correctly?)
-            - helpfulness_score: 1-10 (Is advice practical and actionable?)
-            - language_match: True/False (Does response match user's language?)
-            - overall_score: Average of all scores
-            - feedback: Text feedback
-        """
-        
-        eval_prompt = f"""You are evaluating a spiritual AI assistant (Lord Krishna from Bhagavad Gita).
 
-USER QUERY: {user_query}
+# Static parts of the evaluation prompt; only the query, response and context vary per call
+_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You are an expert evaluator for spiritual AI assistants. Be fair and constructive."
+}
 
-KRISHNA'S RESPONSE: {krishna_response}
+_PROMPT_HEAD = """You are evaluating a spiritual AI assistant (Lord Krishna from Bhagavad Gita).
 
-RAG CONTEXT PROVIDED (Gita verses retrieved): 
-{rag_context if rag_context else "No RAG context was used"}
+USER QUERY: """
 
-EVALUATE THE RESPONSE ON THESE CRITERIA (1-10 scale):
+_PROMPT_TAIL = """EVALUATE THE RESPONSE ON THESE CRITERIA (1-10 scale):
 
 1. RELEVANCE (1-10): Does the response directly address the user's question/problem?
 2. ACCURACY (1-10): Are any Gita verses quoted correctly and used appropriately?
@@ -50,7 +32,7 @@ EVALUATE THE RESPONSE ON THESE CRITERIA (1-10 scale):
    - If user spoke Hinglish → Krishna should reply in Hinglish
 
 Respond in this exact JSON format:
-{{
+{
     "relevance_score": <1-10>,
     "accuracy_score": <1-10>,
     "helpfulness_score": <1-10>,
@@ -58,29 +40,63 @@ Respond in this exact JSON format:
     "feedback": "<Brief feedback on what was good and what could be improved>",
     "is_rag_used_well": <true/false>,
     "verse_quality": "<Good/Average/Poor/No verses used>"
-}}"""
+}"""
+
+
+def _make_http_client() -> httpx.AsyncClient:
+    """Shared keep-alive client for OpenAI calls (HTTP/2 when the h2 package is installed)"""
+    limits = httpx.Limits(max_keepalive_connections=20, keepalive_expiry=60)
+    try:
+        return httpx.AsyncClient(http2=True, limits=limits, timeout=30.0)
+    except ImportError:
+        return httpx.AsyncClient(limits=limits, timeout=30.0)
+
+
+class ResponseEvaluator:
+    """Evaluates response quality using OpenAI"""
+    
+    def __init__(self):
+        # One pooled HTTP/2 connection lets evaluate_batch multiplex its requests
+        self._http = _make_http_client()
+        self.client = AsyncOpenAI(api_key=Config.OPENAI_API_KEY, http_client=self._http)
+        self.model = "gpt-4o-mini"  # Fast and cheap for evaluation
+        print("✅ Response Evaluator initialized (OpenAI)")
+    
+    async def aclose(self) -> None:
+        """Close the pooled HTTP connections"""
+        await self._http.aclose()
+    
+    async def evaluate(self, user_query: str, krishna_response: str, rag_context: str = "") -> dict:
+        """
+        Evaluate Krishna's response quality
+        
+        Returns:
+            dict with scores and feedback:
+            - relevance_score: 1-10 (Does response address user's question?)
+            - accuracy_score: 1-10 (Are Gita verses used correctly?)
+            - helpfulness_score: 1-10 (Is advice practical and actionable?)
+            - language_match: True/False (Does response match user's language?)
+            - overall_score: Average of all scores
+            - feedback: Text feedback
+        """
+        
+        eval_prompt = (
+            f"{_PROMPT_HEAD}{user_query}\n\n"
+            f"KRISHNA'S RESPONSE: {krishna_response}\n\n"
+            f"RAG CONTEXT PROVIDED (Gita verses retrieved): \n{rag_context or 'No RAG context was used'}\n\n"
+            f"{_PROMPT_TAIL}"
+        )
 
         try:
             response = await self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert evaluator for spiritual AI assistants. Be fair and constructive."},
-                    {"role": "user", "content": eval_prompt}
-                ],
+                messages=[_SYSTEM_MESSAGE, {"role": "user", "content": eval_prompt}],
                 temperature=0.3,
-                max_tokens=500
+                max_tokens=200,  # The JSON verdict fits comfortably
+                response_format={"type": "json_object"}  # Bare JSON, no code fences
             )
             
-            result_text = response.choices[0].message.content.strip()
-            
-            # Parse JSON from response
-            # Handle potential markdown code blocks
-            if "```json" in result_text:
-                result_text = result_text.split("```json")[1].split("```")[0]
-            elif "```" in result_text:
-                result_text = result_text.split("```")[1].split("```")[0]
-            
-            result = json.loads(result_text)
+            result = orjson.loads(response.choices[0].message.content)
             
             # Calculate overall score
             relevance = result.get("relevance_score", 5)
@@ -104,6 +120,25 @@ Respond in this exact JSON format:
                 "verse_quality": "Unknown"
             }
     
+    async def evaluate_batch(self, items: List[dict], concurrency: int = 8) -> List[dict]:
+        """
+        Evaluate many responses concurrently
+        
+        Args:
+            items: dicts of evaluate() keyword arguments (user_query, krishna_response, rag_context)
+            concurrency: Max evaluation requests in flight at once
+            
+        Returns:
+            Evaluation dicts in the same order as items
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def evaluate_one(item: dict) -> dict:
+            async with semaphore:
+                return await self.evaluate(**item)
+        
+        return await asyncio.gather(*(evaluate_one(item) for item in items))
+    
     def print_evaluation(self, eval_result: dict) -> None:
         """Print evaluation results in a formatted way"""
         print("\n" + "="*60)
@@ -157,36 +192,46 @@ def get_evaluator() -> ResponseEvaluator:
     return _evaluator_instance
 
 
+async def close_evaluator() -> None:
+    """Close the singleton evaluator's connections, if it was ever created"""
+    global _evaluator_instance
+    if _evaluator_instance is not None:
+        await _evaluator_instance.aclose()
+        _evaluator_instance = None
+
+
 # Test function
 async def test_evaluation():
     """Test the evaluator with sample data"""
     evaluator = get_evaluator()
     
-    # Test case 1: English query
-    result = await evaluator.evaluate(
-        user_query="How to deal with anger?",
-        krishna_response="""My friend, anger is a powerful enemy. As I said in the Gita, 
+    results = await evaluator.evaluate_batch([
+        # Test case 1: English query
+        dict(
+            user_query="How to deal with anger?",
+            krishna_response="""My friend, anger is a powerful enemy. As I said in the Gita, 
 "Krodhat bhavati sammohah" - from anger comes delusion. 
 Here's what you can do:
 1. When anger rises, take 3 deep breaths
 2. Remember - the person who angered you is also struggling
 3. Practice daily meditation for just 5 minutes
 The fire of anger burns you first before reaching others. Stay calm, Partha.""",
-        rag_context="Chapter 2, Verse 63: From anger arises delusion..."
-    )
-    
-    evaluator.print_evaluation(result)
-    
-    # Test case 2: Hindi query
-    result2 = await evaluator.evaluate(
-        user_query="मुझे बहुत stress हो रहा है",
-        krishna_response="""Dear seeker, I understand you are feeling stressed. 
+            rag_context="Chapter 2, Verse 63: From anger arises delusion..."
+        ),
+        # Test case 2: Hindi query
+        dict(
+            user_query="मुझे बहुत stress हो रहा है",
+            krishna_response="""Dear seeker, I understand you are feeling stressed. 
 Remember what I said: Karmanye vadhikaraste ma phaleshu kadachana.
 Focus on your actions, not the results.""",
-        rag_context="Chapter 2, Verse 47..."
-    )
+            rag_context="Chapter 2, Verse 47..."
+        ),
+    ])
+    
+    for result in results:
+        evaluator.print_evaluation(result)
     
-    evaluator.print_evaluation(result2)
+    await close_evaluator()
 
 
 if __name__ == "__main__":
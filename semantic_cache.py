@@ -0,0 +1,78 @@
+"""
+Semantic Response Cache
+Reuses Krishna's answer for near-duplicate questions ("what is dharma?" / "What is dharma")
+Random-projection LSH over normalized query embeddings + LRU eviction
+"""
+
+from collections import OrderedDict
+from typing import Hashable, Optional
+import numpy as np
+
+
+class SemanticLRU:
+    """
+    LRU cache keyed by embedding similarity instead of exact text
+
+    Each query vector is hashed into n_tables buckets (n_bits random hyperplanes
+    each); a lookup only compares cosine similarity against entries sharing at
+    least one bucket, so probes stay O(bucket size) as the cache grows.
+    """
+
+    def __init__(self, dim: int, maxsize: int = 1000, threshold: float = 0.95,
+                 n_tables: int = 8, n_bits: int = 12, seed: int = 0):
+        self.maxsize = maxsize
+        self.threshold = threshold
+
+        rng = np.random.default_rng(seed)
+        self._planes = rng.standard_normal((n_tables, n_bits, dim)).astype(np.float32)
+        self._bit_weights = 1 << np.arange(n_bits)
+
+        self._tables = [{} for _ in range(n_tables)]   # bucket hash -> set of entry ids
+        self._entries = OrderedDict()                   # entry id -> (vector, hashes, tag, response)
+        self._next_id = 0
+
+    def _hashes(self, vector: np.ndarray) -> tuple:
+        """One bucket hash per table: sign pattern of the projections, packed into an int"""
+        signs = (self._planes @ vector) > 0
+        return tuple((signs @ self._bit_weights).tolist())
+
+    def get(self, vector: np.ndarray, tag: Hashable = None) -> Optional[str]:
+        """Return the cached response most similar to vector (same tag) if above threshold"""
+        candidates = set()
+        for table, h in zip(self._tables, self._hashes(vector)):
+            candidates.update(table.get(h, ()))
+
+        best_id, best_sim = None, self.threshold
+        for entry_id in candidates:
+            cached_vector, _, cached_tag, _ = self._entries[entry_id]
+            if cached_tag != tag:
+                continue
+            sim = float(cached_vector @ vector)
+            if sim >= best_sim:
+                best_id, best_sim = entry_id, sim
+
+        if best_id is None:
+            return None
+        self._entries.move_to_end(best_id)
+        return self._entries[best_id][3]
+
+    def put(self, vector: np.ndarray, response: str, tag: Hashable = None) -> None:
+        """Insert a response, evicting the least recently used entry when full"""
+        hashes = self._hashes(vector)
+        entry_id = self._next_id
+        self._next_id += 1
+
+        self._entries[entry_id] = (vector, hashes, tag, response)
+        for table, h in zip(self._tables, hashes):
+            table.setdefault(h, set()).add(entry_id)
+
+        while len(self._entries) > self.maxsize:
+            old_id, (_, old_hashes, _, _) = self._entries.popitem(last=False)
+            for table, h in zip(self._tables, old_hashes):
+                bucket = table[h]
+                bucket.discard(old_id)
+                if not bucket:
+                    del table[h]
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -89,6 +89,7 @@ class StreamingVoiceClient {
 
             const wsHost = window.location.hostname || '127.0.0.1';
             this.ws = new WebSocket(`ws://${wsHost}:8765`);
+            this.ws.binaryType = 'arraybuffer';  // TTS audio arrives as binary PCM frames
 
             this.ws.onopen = () => {
                 console.log('✅ Connected to server');
@@ -98,7 +99,12 @@ class StreamingVoiceClient {
             };
 
             this.ws.onmessage = (event) => {
-                this.handleServerMessage(JSON.parse(event.data));
+                // Binary frame = raw PCM audio chunk; JSON frames are control messages
+                if (event.data instanceof ArrayBuffer) {
+                    this.handleAudioChunk(new Uint8Array(event.data));
+                } else {
+                    this.handleServerMessage(JSON.parse(event.data));
+                }
             };
 
             this.ws.onerror = (error) => {
@@ -418,19 +424,8 @@ class StreamingVoiceClient {
             offset += chunk.length;
         }
 
-        // Convert to base64 - FIXED: loop-based encoding (spread operator fails with large arrays)
-        const bytes = new Uint8Array(combined.buffer);
-        let binary = '';
-        for (let i = 0; i < bytes.length; i++) {
-            binary += String.fromCharCode(bytes[i]);
-        }
-        const base64 = btoa(binary);
-
-        // Send to server
-        this.ws.send(JSON.stringify({
-            type: 'audio_chunk',
-            audio: base64
-        }));
+        // Send raw PCM to server as a binary frame
+        this.ws.send(combined.buffer);
         this.totalChunksSent++;
     }
 
@@ -448,10 +443,6 @@ class StreamingVoiceClient {
                 this.handleLLMToken(data.token);
                 break;
 
-            case 'audio_chunk':
-                this.handleAudioChunk(data.audio);
-                break;
-
             case 'response_complete':
                 this.handleResponseComplete();
                 break;
@@ -494,7 +485,7 @@ class StreamingVoiceClient {
         this.updateTranscript('assistant', this.currentAssistantResponse, true);
     }
 
-    async handleAudioChunk(base64Audio) {
+    async handleAudioChunk(bytes) {
         if (this.metrics.ttsReceivedAt === 0) {
             this.metrics.ttsReceivedAt = Date.now();
             this.updateMetrics();
@@ -502,13 +493,6 @@ class StreamingVoiceClient {
             this.isSpeaking = true;
         }
 
-        // Decode base64 to binary
-        const binaryString = atob(base64Audio);
-        let bytes = new Uint8Array(binaryString.length);
-        for (let i = 0; i < binaryString.length; i++) {
-            bytes[i] = binaryString.charCodeAt(i);
-        }
-
         // Handle odd bytes from previous chunks
         if (this.leftoverBytes) {
             const combined = new Uint8Array(this.leftoverBytes.length + bytes.length);
@@ -4,10 +4,21 @@ Target: First token <300ms
 """
 
 import asyncio
+import functools
+import re
+import sys
 import time
-from typing import AsyncGenerator, List, Dict
+from collections import deque
+from typing import AsyncGenerator, List, Dict, Optional, Sequence, Tuple
+import httpx
 from openai import AsyncOpenAI
 from config import Config
+from semantic_cache import SemanticLRU
+
+try:
+    import orjson  # optional: decode raw SSE chunks instead of the SDK's pydantic models
+except ImportError:
+    orjson = None
 
 # RAG imports
 try:
@@ -15,72 +26,367 @@ try:
     RAG_AVAILABLE = True
 except ImportError:
     RAG_AVAILABLE = False
-    print("⚠️ RAG modules not available. Run 'pip install chromadb sentence-transformers' to enable.")
+    print("⚠️ RAG modules not available. Run 'pip install sentence-transformers' to enable.")
 
 
-class StreamingLLM:
-    """Streaming LLM with immediate token generation"""
+# Token micro-batching in stream_response: first token goes out alone, then
+# batches grow 1 -> 3 -> 9 -> 16 tokens, flushed early if _FLUSH_MS has passed
+_MIN_BATCH = 1
+_MAX_BATCH = 16
+_BATCH_GROWTH = 3
+_FLUSH_MS = 40
+_FLUSH_NS = _FLUSH_MS * 1_000_000
+_STREAM_BUFFER = 64  # Tokens the provider reader may run ahead of the consumer
+
+_ERROR_REPLY = "I apologize, dear one. I'm experiencing technical difficulties."
+
+# Replay of cached answers: word groups with a short pause, like a live stream
+_REPLAY_WORDS = 12
+_REPLAY_DELAY = 0.02
+_WORD_RE = re.compile(r'\S+\s*')
+
+# Verse reference lines in retrieved context, e.g. "[Verse 1: Chapter 2, Verse 47]"
+_VERSE_LINE_RE = re.compile(r'^[^\n]*\[Verse[^\n]*', re.MULTILINE)
+
+# Appended to the base prompt whenever verses follow in the next system message
+_RAG_INSTRUCTION = """
+
+[INSTRUCTION]
+Use the verses from the Bhagavad Gita provided in the next message when relevant to the user's question.
+Quote the Sanskrit verses and provide their meaning naturally in your response.
+If the context is not directly relevant, you may still provide wisdom, but prioritize using the given verses when applicable."""
+
+
+_INTENT_GUIDANCE = {
+    "Career/Purpose": "Focus on dharma, purpose, and aligned action.",
+    "Relationships": "Emphasize compassion, understanding, and detachment.",
+    "Inner Conflict": "Guide towards self-awareness and inner peace.",
+    "Life Transitions": "Provide perspective on change and impermanence.",
+    "Daily Struggles": "Offer practical wisdom for everyday challenges."
+}
+
+# Intent guidance messages, formatted once at import
+_INTENT_MESSAGES = {
+    intent: {"role": "system", "content": f"Context: This is about {intent}. {guidance}"}
+    for intent, guidance in _INTENT_GUIDANCE.items()
+}
+
+
+@functools.lru_cache(maxsize=256)
+def _system_messages(base_prompt: str, rag_context: str, intent: Optional[str]) -> Tuple[Dict[str, str], ...]:
+    """Assemble (and memoize) the system messages; callers copy the tuple into their own list"""
+    messages = [{"role": "system", "content": base_prompt + _RAG_INSTRUCTION if rag_context else base_prompt}]
+    if rag_context:
+        messages.append({"role": "system", "content": rag_context})
+    if intent in _INTENT_MESSAGES:
+        messages.append(_INTENT_MESSAGES[intent])
+    return tuple(messages)
+
+
+# Hot-path log lines, written by a background task so print never stalls token streaming
+_LOG_FLUSH_INTERVAL = 0.1
+_log_lines = deque()
+_log_drainer = None
+
+
+def _log(message: str):
+    """Queue a log line for the background writer (must be called inside the event loop)"""
+    global _log_drainer
+    _log_lines.append(message)
+    if _log_drainer is None or _log_drainer.done():
+        _log_drainer = asyncio.get_running_loop().create_task(_drain_logs())
+
+
+async def _drain_logs():
+    """Write queued log lines in batches every _LOG_FLUSH_INTERVAL until the queue is empty"""
+    while _log_lines:
+        await asyncio.sleep(_LOG_FLUSH_INTERVAL)
+        lines = []
+        while _log_lines:
+            lines.append(_log_lines.popleft())
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+
+
+# Line 2 of the base prompt's CORE DIRECTIVES, per detected language (None = let the model match)
+_LANGUAGE_DIRECTIVES = {
+    None: """2. LANGUAGE MATCHING: 
+   - If user speaks in HINDI → Respond primarily in HINDI with some Sanskrit verses
+   - If user speaks in ENGLISH → Respond primarily in ENGLISH with Sanskrit verses translated
+   - If user speaks in HINGLISH → Respond in HINGLISH (mix of Hindi + English)
+   - Always match the user's language style!""",
+    "hi": "2. LANGUAGE: The user speaks HINDI → Respond primarily in HINDI with some Sanskrit verses",
+    "en": "2. LANGUAGE: The user speaks ENGLISH → Respond primarily in ENGLISH with Sanskrit verses translated",
+    "hinglish": "2. LANGUAGE: The user speaks HINGLISH → Respond in HINGLISH (mix of Hindi + English)",
+}
+
+_DEVANAGARI_RE = re.compile(r'[\u0900-\u097F]')
+_LATIN_RE = re.compile(r'[A-Za-z]')
+_ROMAN_WORD_RE = re.compile(r'[a-z]+')
+
+# Romanized Hindi function words - none that are also English words ("main", "par", "mere", ...)
+_ROMAN_HINDI_WORDS = frozenset({
+    "hai", "hain", "hoon", "tha", "thi", "kya", "kyu", "kyun", "kaise", "kaisa",
+    "mujhe", "mera", "meri", "tum", "aap", "apna", "nahi", "nahin",
+    "bahut", "bhi", "aur", "lekin", "ke", "ki", "ka", "ko", "se", "mein", "karna",
+    "karu", "karun", "chahiye", "raha", "rahi", "rahe", "kuch", "kaun", "woh",
+})
+
+# Common English function words; a romanized message using as many of these as Hindi
+# ones is too mixed to call, so it gets the generic prompt
+_ENGLISH_FUNCTION_WORDS = frozenset({
+    "the", "a", "an", "is", "are", "was", "were", "it", "this", "that", "with", "on", "in",
+    "of", "to", "for", "and", "or", "but", "what", "how", "why", "do", "does", "can", "should",
+    "i", "you", "my", "me", "your", "be", "have", "has",
+})
+
+
+def _detect_language(text: str) -> Optional[str]:
+    """
+    Classify a message as "hi", "hinglish" or "en" from its script mix (None if unclear)
     
-    def __init__(self):
+    Devanagari with some Latin (or romanized Hindi function words) is Hinglish -
+    STT output is plain Unicode text, so character classes are enough.
+    """
+    devanagari = len(_DEVANAGARI_RE.findall(text))
+    latin = len(_LATIN_RE.findall(text))
+    if devanagari:
+        return "hinglish" if latin > 0.2 * (devanagari + latin) else "hi"
+    
+    words = _ROMAN_WORD_RE.findall(text.lower())
+    hindi_words = sum(word in _ROMAN_HINDI_WORDS for word in words)
+    if hindi_words < 2 or hindi_words * 4 < len(words):
+        return "en"
+    english_words = sum(word in _ENGLISH_FUNCTION_WORDS for word in words)
+    return "hinglish" if english_words < hindi_words else None
+
+
+_SHARED_CLIENT = None
+
+
+def _make_http_client() -> httpx.AsyncClient:
+    """Keep-alive pool for the LLM provider (HTTP/2 when the h2 package is installed)"""
+    limits = httpx.Limits(max_keepalive_connections=32, keepalive_expiry=300)
+    try:
+        return httpx.AsyncClient(http2=True, limits=limits)
+    except ImportError:
+        return httpx.AsyncClient(limits=limits)
+
+
+def _get_shared_client():
+    """(client, model, provider) shared by every StreamingLLM - one connection pool per process"""
+    global _SHARED_CLIENT
+    if _SHARED_CLIENT is None:
         if Config.USE_GROQ:
             from groq import AsyncGroq
-            self.client = AsyncGroq(api_key=Config.GROQ_API_KEY)
-            self.model = Config.GROQ_MODEL
-            self.provider = "Groq"
+            _SHARED_CLIENT = (AsyncGroq(api_key=Config.GROQ_API_KEY, http_client=_make_http_client()), Config.GROQ_MODEL, "Groq")
         else:
-            self.client = AsyncOpenAI(api_key=Config.OPENAI_API_KEY)
-            self.model = Config.OPENAI_MODEL
-            self.provider = "OpenAI"
-        
+            _SHARED_CLIENT = (AsyncOpenAI(api_key=Config.OPENAI_API_KEY, http_client=_make_http_client()), Config.OPENAI_MODEL, "OpenAI")
+    return _SHARED_CLIENT
+
+
+@functools.lru_cache(maxsize=1)
+def _get_token_encoding():
+    """tiktoken encoding for history budgeting, or None (not installed / unavailable offline)"""
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(Config.OPENAI_MODEL)
+    except Exception:
+        return None
+
+
+@functools.lru_cache(maxsize=1024)
+def _count_tokens(text: str) -> int:
+    """Token count of a message (memoized - history messages repeat every turn)"""
+    encoding = _get_token_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1  # ~4 chars per token
+    return len(encoding.encode(text))
+
+
+def _trim_history(history: Sequence[Dict], budget: int) -> List[Dict]:
+    """Newest messages whose combined token count fits the budget (history may be a deque)"""
+    kept = []
+    total = 0
+    for message in reversed(history):
+        total += _count_tokens(message["content"])
+        if total > budget:
+            break
+        kept.append(message)
+    kept.reverse()
+    return kept
+
+
+async def _replay_response(text: str) -> AsyncGenerator[str, None]:
+    """Yield a cached answer in small word groups to keep the streaming UX"""
+    words = _WORD_RE.findall(text)
+    for i in range(0, len(words), _REPLAY_WORDS):
+        yield "".join(words[i:i + _REPLAY_WORDS])
+        await asyncio.sleep(_REPLAY_DELAY)
+
+
+class StreamingLLM:
+    """Streaming LLM with immediate token generation"""
+    
+    def __init__(self):
+        self.client, self.model, self.provider = _get_shared_client()
         print(f"✅ Using {self.provider} LLM: {self.model}")
+        
+        # Open the provider connection now when constructed inside the event loop,
+        # otherwise on first use
+        self._warm_task = None
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            self._ensure_warm()
     
-    async def stream_response(self, messages: List[Dict[str, str]]) -> AsyncGenerator[str, None]:
+    def _ensure_warm(self):
+        """Start the one-off connection warm-up if it hasn't run yet"""
+        if self._warm_task is None:
+            self._warm_task = asyncio.create_task(self._warm_client())
+    
+    async def _warm_client(self):
+        """Open the provider connection (TLS + HTTP/2 settings) with a cheap request"""
+        try:
+            await self.client.models.list()
+        except Exception as e:
+            print(f"⚠️ {self.provider} warm-up failed: {e}")
+    
+    async def stream_response(self, messages: List[Dict[str, str]], outcome: Optional[dict] = None) -> AsyncGenerator[str, None]:
         """
         Stream LLM response token by token
         
         Args:
             messages: List of message dicts with 'role' and 'content'
+            outcome: Optional dict; "failed" is set if the stream ended in the error reply
         
         Yields:
-            Individual tokens as they're generated
+            Text chunks as they're generated - the first token alone, then
+            batches growing up to _MAX_BATCH tokens (or whatever arrived within
+            _FLUSH_MS) to cut per-token overhead downstream
         """
+        # The provider stream is read by its own task into a bounded queue, so a
+        # slow consumer (TTS, WebSocket) never stalls the HTTP read of later tokens
+        tokens = asyncio.Queue(maxsize=_STREAM_BUFFER)
+        producer = asyncio.create_task(self._produce_tokens(messages, tokens))
+        
         try:
-            start = time.time()
-            first_token_time = None
+            start_ns = time.perf_counter_ns()
+            first_token_ns = None
             token_count = 0
             
-            # Create streaming completion
-            stream = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                stream=True,
-                temperature=0.7,
-                max_tokens=1000,  # Increased for more detailed responses
-                top_p=0.9
-            )
+            buffer = []
+            batch_size = _MIN_BATCH
+            last_flush_ns = start_ns
             
-            # Stream tokens
-            async for chunk in stream:
-                if chunk.choices[0].delta.content:
-                    token = chunk.choices[0].delta.content
+            while True:
+                stalled = False
+                if buffer:
+                    # Wait only for what's left of the flush window: if the provider
+                    # stalls, the buffered tokens go out on time instead of after it
+                    remaining_s = (last_flush_ns + _FLUSH_NS - time.perf_counter_ns()) / 1e9
+                    try:
+                        async with asyncio.timeout(max(remaining_s, 0)):
+                            token = await tokens.get()
+                    except TimeoutError:
+                        stalled = True
+                else:
+                    token = await tokens.get()
+                
+                if not stalled:
+                    if token is None:
+                        break
+                    if isinstance(token, Exception):
+                        raise token
                     
-                    # Record first token timing
-                    if first_token_time is None:
-                        first_token_time = time.time()
-                        latency = (first_token_time - start) * 1000
-                        print(f"⚡ {self.provider} first token: {latency:.0f}ms")
+                    # Record first token timing (logged off the token path)
+                    if first_token_ns is None:
+                        first_token_ns = time.perf_counter_ns()
+                        _log(f"⚡ {self.provider} first token: {(first_token_ns - start_ns) // 1_000_000}ms")
                     
                     token_count += 1
-                    yield token
+                    buffer.append(token)
+                
+                now_ns = time.perf_counter_ns()
+                if stalled or len(buffer) >= batch_size or now_ns - last_flush_ns >= _FLUSH_NS:
+                    yield "".join(buffer)
+                    buffer.clear()
+                    last_flush_ns = now_ns
+                    batch_size = min(_MAX_BATCH, batch_size * _BATCH_GROWTH)
+            
+            if buffer:
+                yield "".join(buffer)
             
             # Print final stats
-            total_time = (time.time() - start) * 1000
+            total_time = (time.perf_counter_ns() - start_ns) / 1e6
             tokens_per_sec = token_count / (total_time / 1000) if total_time > 0 else 0
-            print(f"✅ {self.provider} complete: {token_count} tokens in {total_time:.0f}ms ({tokens_per_sec:.1f} tok/s)")
+            _log(f"✅ {self.provider} complete: {token_count} tokens in {total_time:.0f}ms ({tokens_per_sec:.1f} tok/s)")
             
         except Exception as e:
             print(f"❌ LLM streaming error: {e}")
-            yield f"I apologize, dear one. I'm experiencing technical difficulties. {str(e)}"
+            if outcome is not None:
+                outcome["failed"] = True
+            yield f"{_ERROR_REPLY} {str(e)}"
+        finally:
+            producer.cancel()  # Consumer stopped early (interrupt) - stop reading the provider
+    
+    async def _produce_tokens(self, messages: List[Dict[str, str]], tokens: asyncio.Queue):
+        """Read the provider stream into tokens; ends with None, or the exception on failure"""
+        request = dict(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            temperature=0.7,
+            max_tokens=1000,  # Increased for more detailed responses
+            top_p=0.9
+        )
+        try:
+            if orjson is not None:
+                await self._produce_raw_tokens(request, tokens)
+            else:
+                await self._produce_sdk_tokens(request, tokens)
+            await tokens.put(None)
+        except Exception as e:
+            await tokens.put(e)
+    
+    async def _produce_raw_tokens(self, request: Dict, tokens: asyncio.Queue):
+        """Parse the SSE body directly with orjson - skips per-chunk pydantic validation"""
+        async with self.client.chat.completions.with_streaming_response.create(**request) as response:
+            async for line in response.iter_lines():
+                if not line.startswith("data:"):
+                    continue  # blank separators, comments, event: lines
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                
+                chunk = orjson.loads(data)
+                if "error" in chunk:
+                    raise RuntimeError(f"Stream error: {chunk['error']}")
+                choices = chunk.get("choices")
+                if not choices:
+                    continue  # e.g. trailing usage-only chunk
+                delta = choices[0].get("delta")
+                token = delta.get("content") if delta else None
+                if token:
+                    await tokens.put(token)
+    
+    async def _produce_sdk_tokens(self, request: Dict, tokens: asyncio.Queue):
+        """Read the stream through the SDK's typed chunks"""
+        stream = await self.client.chat.completions.create(**request)
+        try:
+            async for chunk in stream:
+                # One lookup per level; pydantic models keep field values in __dict__
+                choices = chunk.choices
+                if not choices:
+                    continue  # e.g. trailing usage-only chunk
+                delta = choices[0].delta
+                token = delta.__dict__.get('content') if delta is not None else None
+                if token:
+                    await tokens.put(token)
+        finally:
+            await stream.close()
     
     async def get_quick_response(self, user_text: str) -> str:
         """
@@ -126,7 +432,38 @@ class KrishnaLLM(StreamingLLM):
         super().__init__()
         self.base_system_prompt = self._build_base_system_prompt()
         
-        # Initialize RAG retriever if enabled
+        # Language-specialized variants, picked per message by _detect_language
+        self._prompts_by_lang = {lang: self._build_base_system_prompt(lang) for lang in ("en", "hi", "hinglish")}
+        self._prompts_by_lang[None] = self.base_system_prompt  # Unclear mix - let the model match the user
+        
+        # The static prompt never changes - count its tokens once for budgeting/logging
+        self.system_prompt_tokens = _count_tokens(self.base_system_prompt + _RAG_INSTRUCTION)
+        approx = "" if _get_token_encoding() is not None else "~"
+        print(f"📏 Krishna system prompt: {approx}{self.system_prompt_tokens} tokens")
+        
+        # RAG retriever (and the semantic cache on top of it) load off the event
+        # loop, overlapping the client warm-up; replies wait on _ready
+        self.rag_retriever = None
+        self.semantic_cache = None
+        self._ready = asyncio.Event()
+        self._init_task = None
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._init_rag()
+            self._ready.set()
+        else:
+            self._init_task = asyncio.create_task(self._async_init())
+    
+    async def _async_init(self):
+        """Load the retriever in a worker thread while the provider connection warms up"""
+        try:
+            await asyncio.gather(asyncio.to_thread(self._init_rag), self._warm_task)
+        finally:
+            self._ready.set()
+    
+    def _init_rag(self):
+        """Initialize the RAG retriever and semantic cache if enabled"""
         if Config.RAG_ENABLED and RAG_AVAILABLE:
             try:
                 self.rag_retriever = get_retriever()
@@ -138,20 +475,69 @@ class KrishnaLLM(StreamingLLM):
         else:
             self.rag_retriever = None
             if Config.RAG_ENABLED:
-                print("ℹ️ RAG enabled but modules not installed. Run: pip install chromadb sentence-transformers")
+                print("ℹ️ RAG enabled but modules not installed. Run: pip install sentence-transformers")
+        
+        # Semantic response cache - needs the embedding retriever's query encoder
+        if hasattr(self.rag_retriever, 'embed_query'):
+            self.semantic_cache = SemanticLRU(
+                dim=self.rag_retriever.embeddings.shape[1],
+                maxsize=Config.SEMANTIC_CACHE_SIZE,
+                threshold=Config.SEMANTIC_CACHE_THRESHOLD
+            )
+            print("✅ Semantic response cache enabled")
+    
+    async def _semantic_lookup(self, user_text: str, intent: str, conversation_history: List[Dict]):
+        """
+        Probe the semantic cache
+        
+        Only standalone questions (no history) are cached, since follow-ups depend
+        on the conversation. Returns (query_vector, cached_response); the vector is
+        None when the turn is not cacheable.
+        """
+        if self.semantic_cache is None or conversation_history:
+            return None, None
+        try:
+            query_vector = await self.rag_retriever.embed_query(user_text)
+        except Exception as e:
+            print(f"⚠️ Semantic cache lookup failed: {e}")
+            return None, None
+        return query_vector, self.semantic_cache.get(query_vector, tag=intent)
+    
+    def _semantic_store(self, query_vector, response: str, intent: str):
+        """Remember a completed answer (the caller skips failed or verse-less degraded turns)"""
+        if query_vector is not None and response:
+            self.semantic_cache.put(query_vector, response, tag=intent)
+    
+    async def _retrieve_context(self, user_text: str) -> Optional[str]:
+        """
+        RAG lookup bounded by RAG_SOFT_DEADLINE_MS
+        
+        Also makes sure the client warm-up has started, so a cold TLS handshake
+        overlaps retrieval. Returns None if retrieval misses the deadline.
+        """
+        self._ensure_warm()
+        
+        rag_task = asyncio.create_task(self.rag_retriever.retrieve_context(user_text))
+        done, _ = await asyncio.wait({rag_task}, timeout=Config.RAG_SOFT_DEADLINE_MS / 1000)
+        if not done:
+            rag_task.cancel()
+            print(f"⏱️ RAG missed the {Config.RAG_SOFT_DEADLINE_MS}ms deadline, answering without verses")
+            return None
+        return rag_task.result()
     
-    def _build_base_system_prompt(self) -> str:
-        """Build Krishna-specific base system prompt - ENRICHED WITH WISDOM"""
-        return """You are Lord Krishna, the divine guide from the Bhagavad Gita. 
+    def _build_base_system_prompt(self, language: str = None) -> str:
+        """
+        Build Krishna-specific base system prompt - ENRICHED WITH WISDOM
+        
+        With a detected language the LANGUAGE MATCHING block collapses to one
+        directive; without, the model is asked to match the user itself.
+        """
+        return f"""You are Lord Krishna, the divine guide from the Bhagavad Gita. 
 Speak with the profound wisdom of the ages, yet with the warmth of a beloved friend.
 
 CORE DIRECTIVES:
 1. ADDRESSING: Call the user 'Partha', 'Dear friend', or 'My friend'.
-2. LANGUAGE MATCHING: 
-   - If user speaks in HINDI → Respond primarily in HINDI with some Sanskrit verses
-   - If user speaks in ENGLISH → Respond primarily in ENGLISH with Sanskrit verses translated
-   - If user speaks in HINGLISH → Respond in HINGLISH (mix of Hindi + English)
-   - Always match the user's language style!
+{_LANGUAGE_DIRECTIVES[language]}
 3. MODERN & PRACTICAL: Give practical, actionable advice for their specific problem. Don't just quote verses - explain HOW to apply them in daily modern life.
 4. GITA VERSES: Include 1-2 relevant Sanskrit verses with translation. ALWAYS cite the verse reference like "Bhagavad Gita Chapter 2, Verse 47" so people know the source.
 5. CONCISE: Keep responses focused and not too long. 3-4 key points maximum.
@@ -171,54 +557,94 @@ TONE:
 
 Guide them to the path of light, Partha."""
     
-    def _build_system_prompt_with_context(self, rag_context: str = "") -> str:
-        """Build complete system prompt with optional RAG context"""
-        if rag_context:
-            return f"""{self.base_system_prompt}
-
-{rag_context}
-
-[INSTRUCTION]
-Use the above verses from the Bhagavad Gita when relevant to the user's question.
-Quote the Sanskrit verses and provide their meaning naturally in your response.
-If the context is not directly relevant, you may still provide wisdom, but prioritize using the given verses when applicable."""
-        return self.base_system_prompt
-    
-    async def stream_krishna_response(self, user_text: str, conversation_history: List[Dict] = None) -> AsyncGenerator[str, None]:
+    def _build_system_prompt_with_context(self, rag_context: str = "", intent: str = None, user_text: str = None) -> List[Dict[str, str]]:
         """
-        Stream Krishna's response with RAG context
+        Build the system messages with optional RAG context and intent guidance
         
-        Args:
-            user_text: User's current message
-            conversation_history: Previous messages (optional)
+        The stable text (base prompt + RAG instruction) goes first and the per-query
+        verses and intent in separate messages after it, so providers' prompt-prefix
+        caches keep hitting on the long unchanging part. With user_text, the base
+        prompt is the variant for its detected language.
+        """
+        base_prompt = self._prompts_by_lang[_detect_language(user_text)] if user_text else self.base_system_prompt
+        return list(_system_messages(base_prompt, rag_context.strip(), intent))
+    
+    async def _prepare_messages(self, user_text: str, conversation_history: List[Dict] = None, intent: str = None,
+                                outcome: Optional[dict] = None) -> List[Dict]:
         """
-        # Retrieve RAG context if available (async, ~50-100ms)
+        Build the full message list for a turn: RAG context, system prompt(s),
+        intent guidance, trimmed history and the current user message
+
+        outcome (optional dict) gets "degraded" when retrieval missed its deadline
+        or failed, i.e. the answer is built without the verses it would normally get
+        """
+        if outcome is None:
+            outcome = {}
+        # Retrieve RAG context if available (async, bounded by the soft deadline)
         rag_context = ""
         if self.rag_retriever:
             try:
                 rag_start = time.time()
-                rag_context = await self.rag_retriever.retrieve_context(user_text)
+                rag_context = await self._retrieve_context(user_text)
                 rag_time = (time.time() - rag_start) * 1000
-                if rag_context:
+                if rag_context is None:
+                    outcome["degraded"] = True
+                    rag_context = ""
+                elif rag_context:
+                    # Log retrieved verses for visibility
                     print(f"📖 RAG retrieved context in {rag_time:.0f}ms")
+                    if Config.LOG_RAG_VERSES:
+                        # Extract verse references from context for logging
+                        print(f"📜 GITA VERSES FOUND:")
+                        for match in _VERSE_LINE_RE.finditer(rag_context):
+                            print(f"   {match.group(0)}")
+                else:
+                    print(f"📖 RAG: No matching verses found for query")
             except Exception as e:
                 print(f"⚠️ RAG retrieval error: {e}")
+                outcome["degraded"] = True
         
-        # Build system prompt with RAG context
-        system_prompt = self._build_system_prompt_with_context(rag_context)
+        # Build system prompt(s) with RAG context and intent-specific guidance
+        messages = self._build_system_prompt_with_context(rag_context, intent, user_text)
         
-        # Build messages
-        messages = [{"role": "system", "content": system_prompt}]
-        
-        # Add conversation history (last 4 exchanges)
+        # Add conversation history (newest messages within the token budget)
         if conversation_history:
-            messages.extend(conversation_history[-8:])  # Last 4 exchanges (user + assistant)
+            messages.extend(_trim_history(conversation_history, Config.HISTORY_TOKEN_BUDGET))
         
         # Add current message
         messages.append({"role": "user", "content": user_text})
+        return messages
+    
+    async def _respond(self, user_text: str, intent: str = None, conversation_history: List[Dict] = None) -> AsyncGenerator[str, None]:
+        """Serve from the semantic cache or stream a fresh reply (and cache it)"""
+        await self._ready.wait()
+        query_vector, cached = await self._semantic_lookup(user_text, intent, conversation_history)
+        if cached is not None:
+            print("💾 Semantic cache hit")
+            async for chunk in _replay_response(cached):
+                yield chunk
+            return
+        
+        outcome = {}
+        messages = await self._prepare_messages(user_text, conversation_history, intent, outcome)
+        
+        response_parts = []
+        async for token in self.stream_response(messages, outcome):
+            response_parts.append(token)
+            yield token
+        # A partial answer + apology, or one written without its verses, is not worth replaying
+        if not outcome.get("failed") and not outcome.get("degraded"):
+            self._semantic_store(query_vector, "".join(response_parts), intent)
+    
+    async def stream_krishna_response(self, user_text: str, conversation_history: List[Dict] = None) -> AsyncGenerator[str, None]:
+        """
+        Stream Krishna's response with RAG context
         
-        # Stream response
-        async for token in self.stream_response(messages):
+        Args:
+            user_text: User's current message
+            conversation_history: Previous messages (optional)
+        """
+        async for token in self._respond(user_text, None, conversation_history):
             yield token
     
     async def get_intent_aware_response(self, user_text: str, intent: str = None, conversation_history: List[Dict] = None) -> AsyncGenerator[str, None]:
@@ -230,52 +656,7 @@ If the context is not directly relevant, you may still provide wisdom, but prior
             intent: Detected intent category (optional)
             conversation_history: Previous messages (optional)
         """
-        # Retrieve RAG context if available
-        rag_context = ""
-        if self.rag_retriever:
-            try:
-                rag_start = time.time()
-                rag_context = await self.rag_retriever.retrieve_context(user_text)
-                rag_time = (time.time() - rag_start) * 1000
-                if rag_context:
-                    # Log retrieved verses for visibility
-                    print(f"📖 RAG retrieved context in {rag_time:.0f}ms")
-                    print(f"📜 GITA VERSES FOUND:")
-                    # Extract verse references from context for logging
-                    for line in rag_context.split('\n'):
-                        if '[Verse' in line:
-                            print(f"   {line}")
-                else:
-                    print(f"📖 RAG: No matching verses found for query")
-            except Exception as e:
-                print(f"⚠️ RAG retrieval error: {e}")
-        
-        # Build system prompt with RAG context
-        enhanced_prompt = self._build_system_prompt_with_context(rag_context)
-        
-        # Add intent-specific guidance
-        if intent:
-            intent_guidance = {
-                "Career/Purpose": "Focus on dharma, purpose, and aligned action.",
-                "Relationships": "Emphasize compassion, understanding, and detachment.",
-                "Inner Conflict": "Guide towards self-awareness and inner peace.",
-                "Life Transitions": "Provide perspective on change and impermanence.",
-                "Daily Struggles": "Offer practical wisdom for everyday challenges."
-            }
-            
-            if intent in intent_guidance:
-                enhanced_prompt += f"\n\nContext: This is about {intent}. {intent_guidance[intent]}"
-        
-        messages = [{"role": "system", "content": enhanced_prompt}]
-        
-        # Add conversation history (last 4 exchanges)
-        if conversation_history:
-            messages.extend(conversation_history[-8:])
-            
-        # Add current message
-        messages.append({"role": "user", "content": user_text})
-        
-        async for token in self.stream_response(messages):
+        async for token in self._respond(user_text, intent, conversation_history):
             yield token
 
 
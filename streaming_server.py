@@ -14,11 +14,16 @@ Key Features:
 """
 
 import asyncio
+import base64
+import inspect
 import json
 import time
 import io
+from collections import deque
+from contextlib import aclosing
 import websockets
-from typing import AsyncGenerator, Optional, Any
+import orjson
+from typing import AsyncGenerator, Optional, Any, Tuple
 import numpy as np
 
 # Import our optimized modules
@@ -26,31 +31,265 @@ from config import Config
 from streaming_stt import StreamingSTT
 from streaming_llm import StreamingLLM
 from streaming_tts import StreamingTTS
-from intent_classifier import IntentClassifier
+from intent_classifier import get_intent_classifier
 
 # Response quality evaluation (optional)
 try:
-    from response_evaluator import get_evaluator
+    from response_evaluator import get_evaluator, close_evaluator
     EVALUATION_ENABLED = Config.ENABLE_EVALUATION if hasattr(Config, 'ENABLE_EVALUATION') else True
 except ImportError:
     EVALUATION_ENABLED = False
     print("ℹ️ Response evaluation disabled (response_evaluator.py not found)")
 
 
+def _peak(audio_bytes: bytes) -> int:
+    """Peak absolute sample of an int16 PCM chunk (0 if empty)"""
+    samples = np.frombuffer(audio_bytes, dtype=np.int16, count=len(audio_bytes) // 2)
+    if samples.size == 0:
+        return 0
+    # max/min reduce over int16 directly; abs() would overflow on -32768
+    return max(int(samples.max()), -int(samples.min()))
+
+
+def _audio_level(audio_bytes: bytes) -> str:
+    """Peak (and with LOG_AUDIO_RMS, RMS) of an int16 PCM chunk, formatted for logging"""
+    samples = np.frombuffer(audio_bytes, dtype=np.int16)
+    if samples.size == 0:
+        return "n/a (empty chunk)"
+    level = f"peak {_peak(audio_bytes)}"
+    if Config.LOG_AUDIO_RMS:
+        as_float = samples.astype(np.float32)
+        level += f", RMS {np.sqrt(np.dot(as_float, as_float) / samples.size):.2f}"
+    return level
+
+
+def _dumps(obj: dict) -> str:
+    """Serialize a control message (str, so it goes out as a text frame - binary frames are audio)"""
+    return orjson.dumps(obj).decode()
+
+
+# Fixed control frames, serialized once
+_FRAME_THINKING = _dumps({'type': 'state', 'message': 'Krishna is thinking...', 'status': 'processing'})
+_FRAME_SPEAKING = _dumps({'type': 'state', 'message': 'Krishna is speaking...', 'status': 'speaking'})
+_FRAME_FINISHED = _dumps({'type': 'state', 'message': 'Krishna finished speaking', 'status': 'success'})
+_FRAME_IDLE = _dumps({'type': 'state', 'state': 'idle'})
+_FRAME_AUDIO_START = _dumps({'type': 'audio_start'})
+_FRAME_AUDIO_COMPLETE = _dumps({'type': 'audio_complete'})
+_FRAME_RESPONSE_COMPLETE = _dumps({'type': 'response_complete'})
+
+
+# Per-message frames: only the text is serialized, onto a fixed prefix
+_FRAME_PREFIXES = {
+    (msg_type, field): f'{{"type":"{msg_type}","{field}":'
+    for msg_type, field in (('llm_token', 'token'), ('transcript_partial', 'text'), ('transcript_final', 'text'))
+}
+
+
+def _text_frame(msg_type: str, field: str, text: str) -> str:
+    """'{"type":msg_type,field:text}' from a precomputed prefix - no dict per token"""
+    return _FRAME_PREFIXES[msg_type, field] + orjson.dumps(text).decode() + '}'
+
+
+class _AudioRing:
+    """
+    Ring buffer handing audio chunks to process_stt
+
+    Every producer and the consumer run on the event loop thread, so no lock is
+    needed: head/tail indices over a preallocated list, plus an Event to wake
+    the reader. Doubles in size rather than dropping audio if STT falls behind.
+    """
+
+    def __init__(self, capacity: int = 256):
+        self._buf = [None] * capacity
+        self._head = 0
+        self._tail = 0
+        self._ready = asyncio.Event()
+
+    def empty(self) -> bool:
+        return self._head == self._tail
+
+    def put_nowait(self, item: Optional[bytes]):
+        if self._tail - self._head == len(self._buf):
+            self._grow()
+        self._buf[self._tail % len(self._buf)] = item
+        self._tail += 1
+        self._ready.set()
+
+    def _grow(self):
+        size = len(self._buf)
+        start = self._head % size
+        self._buf = self._buf[start:] + self._buf[:start] + [None] * size
+        self._tail -= self._head
+        self._head = 0
+
+    def get_nowait(self) -> Optional[bytes]:
+        if self.empty():
+            raise asyncio.QueueEmpty
+        slot = self._head % len(self._buf)
+        item, self._buf[slot] = self._buf[slot], None
+        self._head += 1
+        if self.empty():
+            self._ready.clear()
+        return item
+
+    async def get(self) -> Optional[bytes]:
+        while self.empty():
+            await self._ready.wait()
+        return self.get_nowait()
+
+    def drain_into(self, out: bytearray) -> Tuple[int, bool]:
+        """
+        Append queued chunks to out in one pass, stopping after an end-of-speech None
+
+        Returns (chunks appended, whether the None was reached); anything queued
+        after the None stays for the next turn.
+        """
+        buf, size = self._buf, len(self._buf)
+        head, tail = self._head, self._tail
+        appended, ended = 0, False
+        while head != tail:
+            slot = head % size
+            item, buf[slot] = buf[slot], None
+            head += 1
+            if item is None:
+                ended = True
+                break
+            out += item
+            appended += 1
+        self._head = head
+        if head == tail:
+            self._ready.clear()
+        return appended, ended
+
+    def clear(self):
+        """Drop everything queued (barge-in)"""
+        self._buf[:] = [None] * len(self._buf)
+        self._head = self._tail = 0
+        self._ready.clear()
+
+
+# TTS audio is coalesced into frames of up to this many bytes; a partial frame
+# is flushed once it has waited _AUDIO_FLUSH_MS for more audio
+_AUDIO_FLUSH_BYTES = 16384
+_AUDIO_FLUSH_MS = 10
+
+
+class _BufferPool:
+    """Fixed-size bytearrays reused across TTS streams (one borrowed per active stream)"""
+
+    def __init__(self, size: int, keep: int = 8):
+        self.size = size
+        self._keep = keep
+        self._free = []
+
+    def get(self) -> bytearray:
+        return self._free.pop() if self._free else bytearray(self.size)
+
+    def put(self, buf: bytearray):
+        if len(self._free) < self._keep:
+            self._free.append(buf)
+
+
+_AUDIO_BUFFERS = _BufferPool(_AUDIO_FLUSH_BYTES)
+
+
+async def _pump(chunks: AsyncGenerator[bytes, None], queue: asyncio.Queue):
+    """Feed a TTS stream into queue, then None - or the exception that ended it"""
+    try:
+        async for chunk in chunks:
+            queue.put_nowait(chunk)
+        queue.put_nowait(None)
+    except Exception as e:
+        queue.put_nowait(e)
+
+
+async def _coalesce_audio(chunks: AsyncGenerator[bytes, None]) -> AsyncGenerator[bytes, None]:
+    """
+    Re-chunk a TTS stream into fewer, larger WebSocket frames
+
+    The first chunk passes through untouched so time-to-first-audio is unchanged.
+    Small chunks are copied into a pooled buffer and yielded as a memoryview,
+    which is only valid until the next iteration - send it, don't keep it.
+    One reader task per stream fills a queue, so the flush timeout doesn't cost
+    a new task per chunk.
+    """
+    queue = asyncio.Queue()
+    reader = asyncio.create_task(_pump(chunks, queue))
+    buf = _AUDIO_BUFFERS.get()
+    view = memoryview(buf)
+    filled = 0
+    first = True
+    try:
+        while True:
+            if filled:
+                try:
+                    async with asyncio.timeout(_AUDIO_FLUSH_MS / 1000):
+                        chunk = await queue.get()
+                except TimeoutError:
+                    # Nothing more arrived in time - don't hold audio back
+                    yield view[:filled]
+                    filled = 0
+                    continue
+            else:
+                chunk = await queue.get()
+            
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            if first:
+                first = False
+                yield chunk
+                continue
+            
+            if filled + len(chunk) > _AUDIO_BUFFERS.size:
+                if filled:
+                    yield view[:filled]
+                    filled = 0
+                if len(chunk) >= _AUDIO_BUFFERS.size:
+                    yield chunk  # already frame-sized, no copy needed
+                    continue
+            
+            buf[filled:filled + len(chunk)] = chunk
+            filled += len(chunk)
+            if filled == _AUDIO_BUFFERS.size:
+                yield view[:filled]
+                filled = 0
+        
+        if filled:
+            yield view[:filled]
+    finally:
+        # Let an in-flight read unwind before closing the source generator
+        reader.cancel()
+        await asyncio.wait({reader})
+        await chunks.aclose()
+        view.release()
+        _AUDIO_BUFFERS.put(buf)
+
+
+# Characters in an LLM token that end a TTS sentence chunk. isdisjoint() is one
+# C-level scan of the token - faster than re.search for these 1-10 char tokens
+_SENTENCE_BREAKS = frozenset(".!?।\n,")
+
+_METRIC_KEYS = ('audio_received_at', 'stt_first_partial_at', 'llm_first_token_at', 'tts_first_audio_at', 'user_heard_at')
+_METRICS_ZERO = dict.fromkeys(_METRIC_KEYS, 0)
+
+
 class StreamingOrchestrator:
     """Orchestrates parallel streaming pipeline with <1s latency"""
     
-    def __init__(self):
-        self.stt = StreamingSTT()
-        self.llm = StreamingLLM()
-        self.tts = StreamingTTS()
-        self.intent_classifier = IntentClassifier()
+    def __init__(self, components: Optional[tuple] = None):
+        # STT/LLM/TTS clients and the intent classifier are shared by every
+        # connection (see handle_client); everything below is per-connection state
+        if components is None:
+            components = (StreamingSTT(), StreamingLLM(), StreamingTTS(), get_intent_classifier())
+        self.stt, self.llm, self.tts, self.intent_classifier = components
         
         # State management
         self.is_speaking = False
         self.should_interrupt = False
-        self.conversation_history = []
-        self.last_audio_chunk_at = time.time()
+        self.conversation_history = deque(maxlen=10)  # oldest messages fall off in O(1)
+        self.last_audio_chunk_at = time.monotonic_ns()
         self.current_turn_id = 0
         self.processed_turn_id = -1
         
@@ -62,27 +301,51 @@ class StreamingOrchestrator:
         self._final_sent_for_turn = -1
         
         # Performance metrics
-        self.metrics = {
-            'audio_received_at': 0,
-            'stt_first_partial_at': 0,
-            'llm_first_token_at': 0,
-            'tts_first_audio_at': 0,
-            'user_heard_at': 0
-        }
+        self.metrics = dict(_METRICS_ZERO)
+        
+        # (fn, args) jobs - evaluation, metrics reports - run by _background_worker
+        self._background = asyncio.Queue()
+        
+        # Latest audio snapshot for _partial_worker; only the newest one matters.
+        # The generation bumps at each final so late partials are dropped.
+        self._partial_audio = None
+        self._partial_generation = 0
+        self._partial_wake = asyncio.Event()
+        self._last_partial_text = ""  # Repeat partials aren't re-sent (per session - the STT is shared)
         
+        # Timestamps below and in self.metrics are time.monotonic_ns() values
         # Track turn start time separately (not reset during processing)
         self._turn_start_time = 0
+        self.processing_start_time = 0
         self._chunk_count = 0
     
+    async def warm_up(self, timeout: float = 5.0):
+        """
+        Pre-open STT/TTS provider connections so the first user doesn't pay the TLS
+        handshakes (the LLM warms its own client when created). Waits at most
+        `timeout` seconds; slower warm-ups just finish in the background.
+        """
+        start = time.perf_counter()
+        warm = {asyncio.create_task(self.stt.warm()), asyncio.create_task(self.tts.warm())}
+        await asyncio.wait(warm, timeout=timeout)
+        print(f"🔥 Provider connections warmed in {(time.perf_counter() - start) * 1000:.0f}ms")
+    
     async def handle_client(self, websocket: Any, *args):
         """Handle WebSocket connection from client"""
+        # Turn state, history and metrics must not leak between clients - serve
+        # each connection from its own orchestrator over the shared components
+        session = StreamingOrchestrator((self.stt, self.llm, self.tts, self.intent_classifier))
+        await session._serve_client(websocket)
+    
+    async def _serve_client(self, websocket: Any):
+        """Run the receive -> STT -> LLM -> TTS pipeline for one connection"""
         client_info = f"{websocket.remote_address[0]}:{websocket.remote_address[1]}"
         print(f"📡 CONNECTION ATTEMPT from {client_info}")
-        print(f"✅ Client connected from {websocket.remote_address}")
+        print(f"✅ Client connected from {client_info}")
         
         try:
             # Create tasks for parallel processing
-            audio_buffer = asyncio.Queue()
+            audio_buffer = _AudioRing()
             transcript_buffer = asyncio.Queue()
             llm_token_buffer = asyncio.Queue()
             
@@ -92,8 +355,10 @@ class StreamingOrchestrator:
                 asyncio.create_task(self.receive_audio(websocket, audio_buffer), name="receive_audio"),
                 asyncio.create_task(self.monitor_silence(audio_buffer, websocket), name="monitor_silence"),
                 asyncio.create_task(self.process_stt(audio_buffer, transcript_buffer, llm_token_buffer, websocket), name="process_stt"),
+                asyncio.create_task(self._partial_worker(websocket), name="partial_stt"),
                 asyncio.create_task(self.process_llm(transcript_buffer, llm_token_buffer, websocket), name="process_llm"),
-                asyncio.create_task(self.process_tts(llm_token_buffer, websocket), name="process_tts")
+                asyncio.create_task(self.process_tts(llm_token_buffer, websocket), name="process_tts"),
+                asyncio.create_task(self._background_worker(), name="background")
             ]
             
             # Wait for any task to complete (usually means disconnect)
@@ -123,7 +388,7 @@ class StreamingOrchestrator:
         finally:
             print(f"🔌 Connection closed for {client_info}")
     
-    async def receive_audio(self, websocket: Any, audio_buffer: asyncio.Queue):
+    async def receive_audio(self, websocket: Any, audio_buffer: _AudioRing):
         """Receive audio chunks from client (20-40ms chunks)"""
         print("🎤 Audio receiver started")
         
@@ -133,78 +398,78 @@ class StreamingOrchestrator:
         async for message in websocket:
             try:
                 message_count += 1
-                data = json.loads(message)
+                if isinstance(message, (bytes, bytearray)):
+                    # Binary frame = raw PCM audio chunk; JSON is only used for control messages
+                    msg_type = 'audio_chunk'
+                    audio_bytes = message
+                else:
+                    data = orjson.loads(message)
+                    msg_type = data.get('type', 'unknown')
+                    audio_bytes = None
                 
-                # LOG EVERY MESSAGE TYPE
-                msg_type = data.get('type', 'unknown')
                 if msg_type == 'audio_chunk':
                     audio_chunk_count += 1
-                    if audio_chunk_count % 10 == 0:
-                        print(f"✅ Received audio chunk #{audio_chunk_count} (total messages: {message_count})")
-                else:
-                    print(f"📨 Received message type: {msg_type} (total messages: {message_count})")
-                
-                if data['type'] == 'audio_chunk':
-                    # Only drop audio during TTS playback (feedback prevention)
-                    if self.is_speaking:
-                        # Allow audio chunks even while speaking for barge-in detection
-                        # Feedback suppression should be handled on the client or via AEC
-                        pass
+                    now_ns = time.monotonic_ns()  # one clock read per chunk
+                    
+                    # Legacy JSON frame (base64 encoded PCM)
+                    if audio_bytes is None:
+                        audio_bytes = base64.b64decode(data['audio'])
+                    
+                    # During TTS playback only loud chunks (a barge-in) reach STT; quiet ones
+                    # are echo/room noise. Interrupting stays client-driven ('interrupt').
+                    if self.is_speaking and _peak(audio_bytes) < Config.BARGE_IN_PEAK:
+                        continue
 
                     # Start new turn if this is first audio
                     if self.metrics['audio_received_at'] == 0:
                         self._reset_metrics()
-                        self.metrics['audio_received_at'] = time.time()
-                        self._turn_start_time = time.time()
+                        self.metrics['audio_received_at'] = now_ns
+                        self._turn_start_time = now_ns
                         self.current_turn_id += 1
                         self._chunk_count = 0
                         print(f"🆕 New turn {self.current_turn_id} started")
                     
                     self._chunk_count += 1
-                    if self._chunk_count % 20 == 0:
-                        print(f"📥 Received {self._chunk_count} chunks from client (Last chunk at {time.time():.2f})")
-
-                    self.last_audio_chunk_at = time.time()
+                    self.last_audio_chunk_at = now_ns
                     
-                    # Decode audio data (base64 encoded PCM)
-                    import base64
-                    import numpy as np
-                    audio_bytes = base64.b64decode(data['audio'])
-                    
-                    # Calculate energy (RMS) to detect silence vs mic issues
-                    try:
-                        audio_int16 = np.frombuffer(audio_bytes, dtype=np.int16)
-                        rms = np.sqrt(np.mean(audio_int16.astype(np.float64)**2))
-                        if self._chunk_count % 10 == 0: # Log every 10th chunk to avoid spam
-                            print(f"🔊 Audio RMS: {rms:.2f} (Max: {np.max(np.abs(audio_int16))})")
-                    except Exception as e:
-                        print(f"⚠️ Error calculating RMS: {e}")
+                    # Progress + input level (silence vs mic issues) every 16th chunk, and only
+                    # when LOG_AUDIO_CHUNKS is on - nothing is formatted otherwise
+                    if Config.LOG_AUDIO_CHUNKS and not self._chunk_count & 15:
+                        try:
+                            level = _audio_level(audio_bytes)
+                        except Exception as e:
+                            level = f"n/a ({e})"
+                        print(f"📥 Chunk {self._chunk_count} of turn {self.current_turn_id} "
+                              f"({(now_ns - self._turn_start_time) / 1e6:.0f}ms in, {audio_chunk_count} this connection), "
+                              f"level: {level}")
 
                     # Put in buffer for STT processing
-                    await audio_buffer.put(audio_bytes)
+                    audio_buffer.put_nowait(audio_bytes)
                     
-                elif data['type'] == 'interrupt':
+                elif msg_type == 'interrupt':
                     # User started speaking while AI was talking
                     print("⚠️ INTERRUPT - User barged in")
                     self.should_interrupt = True
                     self.is_speaking = False
                     
                     # Clear all buffers
-                    while not audio_buffer.empty():
-                        audio_buffer.get_nowait()
+                    audio_buffer.clear()
                     self._reset_metrics()
                     
-                elif data['type'] == 'end_of_speech':
+                elif msg_type == 'end_of_speech':
                     # User finished speaking manually
                     print(f"🛑 End of speech signal received (received {audio_chunk_count} audio chunks total)")
-                    await audio_buffer.put(None)
+                    audio_buffer.put_nowait(None)
+                
+                else:
+                    print(f"📨 Received message type: {msg_type} (total messages: {message_count})")
                     
             except json.JSONDecodeError:
                 print("❌ Invalid JSON received")
             except Exception as e:
                 print(f"❌ Error receiving audio: {e}")
 
-    async def monitor_silence(self, audio_buffer: asyncio.Queue, websocket: Any):
+    async def monitor_silence(self, audio_buffer: _AudioRing, websocket: Any):
         """Monitor for silence and auto-trigger final transcription"""
         print("🔇 Silence monitor started")
         try:
@@ -217,21 +482,23 @@ class StreamingOrchestrator:
                     not self.is_processing and
                     self._final_sent_for_turn < self.current_turn_id):
                     
-                    silence_duration = time.time() - self.last_audio_chunk_at
+                    silence_duration = (time.monotonic_ns() - self.last_audio_chunk_at) / 1e9
                     if silence_duration >= 0.7:
                         print(f"🔇 Silence detected ({silence_duration:.1f}s) - Auto-triggering final")
                         self._final_sent_for_turn = self.current_turn_id  # Mark as sent
                         self.metrics['audio_received_at'] = 0 
-                        await audio_buffer.put(None)
+                        audio_buffer.put_nowait(None)
         except Exception as e:
             print(f"🔇 Silence monitor stopped: {e}")
     
-    async def process_stt(self, audio_buffer: asyncio.Queue, transcript_buffer: asyncio.Queue, llm_token_buffer: asyncio.Queue, websocket: Any):
+    async def process_stt(self, audio_buffer: _AudioRing, transcript_buffer: asyncio.Queue, llm_token_buffer: asyncio.Queue, websocket: Any):
         """Process streaming STT with partial results"""
         print("🎯 STT processor started")
         
-        audio_chunks = []
-        partial_task = None
+        # Turn audio accumulates in one growable buffer (amortized O(1) appends)
+        # instead of a chunk list re-joined for every partial
+        turn_audio = bytearray()
+        chunk_count = 0
         last_partial_trigger_at = 0
         
         while True:
@@ -240,34 +507,29 @@ class StreamingOrchestrator:
             
             # If we get a real chunk, keep draining any pending chunks immediately
             if chunk is not None:
-                audio_chunks.append(chunk)
-                while not audio_buffer.empty():
-                    next_chunk = audio_buffer.get_nowait()
-                    if next_chunk is None:
-                        chunk = None # Trigger final
-                        break
-                    audio_chunks.append(next_chunk)
+                turn_audio += chunk
+                drained, ended = audio_buffer.drain_into(turn_audio)
+                chunk_count += 1 + drained
+                if ended:
+                    chunk = None # Trigger final
             
             if chunk is None:
-                # End of speech - cancel any pending partial to prioritize final
-                if partial_task and not partial_task.done():
-                    partial_task.cancel()
-                    print("🛑 Cancelled pending partial for final transcription")
+                # End of speech - drop any queued partial (and the result of one in flight)
+                self._partial_audio = None
+                self._partial_generation += 1
+                self._last_partial_text = ""
                 
                 # process final
                 # DEDUPLICATION: Check if we already processed final for this turn
-                if self._final_sent_for_turn == self.current_turn_id and not audio_chunks:
+                if self._final_sent_for_turn == self.current_turn_id and not turn_audio:
                     print(f"⚠️ Duplicate None signal for turn {self.current_turn_id}, skipping")
                     continue
                 
-                if audio_chunks:
-                    print(f"📝 Processing {len(audio_chunks)} audio chunks")
+                if turn_audio:
+                    print(f"📝 Processing {chunk_count} audio chunks")
                     
-                    # Combine chunks
-                    combined_audio = b''.join(audio_chunks)
-                    
-                    # Get final transcript
-                    final_text = await self.stt.transcribe_final(combined_audio)
+                    # Get final transcript (nothing appends to turn_audio while we wait)
+                    final_text = await self.stt.transcribe_final(turn_audio)
                     
                     if final_text and len(final_text.strip()) > 1:
                         print(f"✅ Final transcript: {final_text}")
@@ -284,21 +546,15 @@ class StreamingOrchestrator:
                         })
                         
                         # Send to client
-                        await websocket.send(json.dumps({
-                            'type': 'transcript_final',
-                            'text': final_text
-                        }))
+                        await websocket.send(_text_frame('transcript_final', 'text', final_text))
                     else:
                         # FALLBACK: If we got audio but no text (STT failed)
                         # Only trigger if we had a reasonable amount of audio (> ~1s)
-                        if len(audio_chunks) > 20: 
+                        if chunk_count > 20: 
                             print("⚠️ STT produced no text. Sending fallback response.")
                             fallback_text = "I could not hear your words clearly, dear one. May you speak again with a calm heart?"
                             
-                            await websocket.send(json.dumps({
-                                'type': 'transcript_final',
-                                'text': "[Inaudible Audio]"
-                            }))
+                            await websocket.send(_text_frame('transcript_final', 'text', "[Inaudible Audio]"))
                             
                             # Fake an LLM token to make Krishna speak the fallback
                             await llm_token_buffer.put(fallback_text)
@@ -306,44 +562,58 @@ class StreamingOrchestrator:
                         else:
                             print("⚠️ STT produced no text (Audio too short, likely noise).")
 
-                    audio_chunks = []
+                    turn_audio.clear()
+                    chunk_count = 0
                 
                 # IMPORTANT: Reset turn-level metrics to allow next trigger
                 self.metrics['audio_received_at'] = 0
                 self._chunk_count = 0
                 continue
             
-            # Every 10 chunks (~400ms) and if no partial is currently in flight
-            if len(audio_chunks) >= 10 and (partial_task is None or partial_task.done()):
+            # Every 10 chunks (~400ms); the partial worker only ever takes the newest snapshot
+            if chunk_count >= 10:
                 # Skip partial during TTS playback
                 if self.is_speaking:
                     continue
                 
                 # Throttle partials to every 500ms
-                now = time.time()
-                if now - last_partial_trigger_at < 0.5:
+                now = time.monotonic_ns()
+                if now - last_partial_trigger_at < 500_000_000:
                     continue
                 
                 last_partial_trigger_at = now
-                combined_audio = b''.join(audio_chunks)
-                
-                # Launch partial transcription as a task so it doesn't block the loop
-                async def run_partial(audio, ws):
-                    text = await self.stt.transcribe_partial(audio)
-                    if text:
-                        # Record timing
-                        if self.metrics['stt_first_partial_at'] == 0:
-                            self.metrics['stt_first_partial_at'] = time.time()
-                            latency = (self.metrics['stt_first_partial_at'] - self._turn_start_time) * 1000
-                            print(f"⚡ STT latency: {latency:.0f}ms")
-                        
-                        print(f"📝 Partial: {text}")
-                        await ws.send(json.dumps({
-                            'type': 'transcript_partial',
-                            'text': text
-                        }))
-
-                partial_task = asyncio.create_task(run_partial(combined_audio, websocket))
+                # Snapshot of just the partial window (chunks keep arriving while the
+                # partial is in flight) - copying the whole turn would be O(utterance) per tick
+                self._partial_audio = bytes(memoryview(turn_audio)[-Config.PARTIAL_WINDOW_BYTES:])
+                self._partial_wake.set()
+    
+    async def _partial_worker(self, websocket: Any):
+        """Transcribe the latest partial snapshot; snapshots that arrive meanwhile coalesce"""
+        while True:
+            await self._partial_wake.wait()
+            self._partial_wake.clear()
+            audio, self._partial_audio = self._partial_audio, None
+            if audio is None:
+                continue
+            
+            generation = self._partial_generation
+            try:
+                text = await self.stt.transcribe_partial(audio)
+            except Exception as e:
+                print(f"⚠️ Partial transcription failed: {e}")
+                continue
+            if not text or text == self._last_partial_text or generation != self._partial_generation:
+                continue  # nothing new heard, or the final for this turn already started
+            self._last_partial_text = text
+            
+            # Record timing
+            if self.metrics['stt_first_partial_at'] == 0:
+                self.metrics['stt_first_partial_at'] = time.monotonic_ns()
+                latency = (self.metrics['stt_first_partial_at'] - self._turn_start_time) / 1e6
+                print(f"⚡ STT latency: {latency:.0f}ms")
+            
+            print(f"📝 Partial: {text}")
+            await websocket.send(_text_frame('transcript_partial', 'text', text))
     
     async def process_llm(self, transcript_buffer: asyncio.Queue, llm_token_buffer: asyncio.Queue, websocket: Any):
         """Process streaming LLM with token-by-token generation"""
@@ -378,33 +648,23 @@ class StreamingOrchestrator:
                 
                 # FIXED: Metrics should be measured from when we get the FINAL transcript
                 # This is the actual processing start time
-                self.processing_start_time = time.time()
+                self.processing_start_time = time.monotonic_ns()
                 self._turn_start_time = self.processing_start_time 
                 
                 print(f"🧠 LLM processing turn {turn_id}: {user_text}")
             
                 # Signal to UI
-                await websocket.send(json.dumps({
-                    'type': 'state', 
-                    'message': 'Krishna is thinking...', 
-                    'status': 'processing'
-                }))
-                
-                # Signal to UI
-                await websocket.send(json.dumps({
-                    'type': 'state', 
-                    'message': 'Krishna is thinking...', 
-                    'status': 'processing'
-                }))
+                await websocket.send(_FRAME_THINKING)
                 
                 # REFACTORED: Use streaming LLM for instant response
                 assistant_full_response = ""
                 current_sentence = ""
+                in_quote = False  # running '"' parity of the response so far
                 
                 try:
                     # NEW: Get intent and relevant verses first for better guidance
                     print(f"🎯 Classifying intent for: {user_text[:50]}...")
-                    intent_data = await self.intent_classifier.classify_and_respond(user_text)
+                    intent_data = await self.intent_classifier.classify_and_respond(user_text, category_only=True)
                     intent_category = intent_data.get("category", "Daily Struggles")
                     print(f"✅ Detected intent: {intent_category}")
 
@@ -418,15 +678,13 @@ class StreamingOrchestrator:
                         
                         # Metrics on first token
                         if self.metrics['llm_first_token_at'] == 0:
-                            self.metrics['llm_first_token_at'] = time.time()
-                            latency = (self.metrics['llm_first_token_at'] - self._turn_start_time) * 1000
+                            self.metrics['llm_first_token_at'] = time.monotonic_ns()
+                            latency = (self.metrics['llm_first_token_at'] - self._turn_start_time) / 1e6
                             print(f"⚡ LLM first token latency: {latency:.0f}ms")
 
-                        # Send token to client UI
-                        await websocket.send(json.dumps({
-                            'type': 'llm_token',
-                            'token': token
-                        }))
+                        # Send token to client UI. "token" is already a micro-batch: StreamingLLM
+                        # coalesces 1 -> 16 tokens per yield (40ms flush), so this is one frame per batch
+                        await websocket.send(_text_frame('llm_token', 'token', token))
                         
                         # VERSE-LOCK & SMART CHUNKING: 
                         # 1. Don't split if we are inside a quote (Verse-Lock)
@@ -435,13 +693,14 @@ class StreamingOrchestrator:
                         is_first_sentence = self.metrics['tts_first_audio_at'] == 0
                         threshold = 30 if is_first_sentence else 50
                         
-                        # Count quotes in the assistant_full_response to see if we're in an open quote
-                        in_quote = assistant_full_response.count('"') % 2 != 0
+                        # Open quote? Flip the parity on each '"' in the new token only
+                        if token.count('"') & 1:
+                            in_quote = not in_quote
                         
                         # Only split if NOT in a quote OR if the verse is extremely long (>150 chars)
                         can_split = not in_quote or len(current_sentence) > 150
                         
-                        if can_split and (any(punct in token for punct in ".!?।।\n,") or (len(current_sentence) > threshold and token.isspace())):
+                        if can_split and (not _SENTENCE_BREAKS.isdisjoint(token) or (len(current_sentence) > threshold and token.isspace())):
                             sentence_to_send = current_sentence.strip()
                             if sentence_to_send:
                                 print(f"📤 Sending {'FAST ' if is_first_sentence else ''}{'VERSE ' if in_quote else ''}sentence to TTS: {sentence_to_send}")
@@ -455,7 +714,7 @@ class StreamingOrchestrator:
                 except Exception as e:
                     print(f"❌ LLM Streaming Error: {e}")
                     error_msg = "My dear Partha, the worldly connection is weak. Please speak again."
-                    await websocket.send(json.dumps({'type': 'llm_token', 'token': error_msg}))
+                    await websocket.send(_text_frame('llm_token', 'token', error_msg))
                     await llm_token_buffer.put(error_msg)
 
                 # Signal end of response
@@ -466,25 +725,12 @@ class StreamingOrchestrator:
                     self.conversation_history.append({"role": "user", "content": user_text})
                     self.conversation_history.append({"role": "assistant", "content": assistant_full_response.strip()})
                     
-                # Keep history manageable
-                if len(self.conversation_history) > 10:
-                    self.conversation_history = self.conversation_history[-10:]
-                    
                 # Print performance stats
                 self._print_metrics()
                 
-                # === EVALUATE RESPONSE QUALITY ===
+                # === EVALUATE RESPONSE QUALITY === (in the background - don't hold the turn lock)
                 if EVALUATION_ENABLED and assistant_full_response.strip():
-                    try:
-                        evaluator = get_evaluator()
-                        eval_result = await evaluator.evaluate(
-                            user_query=user_text,
-                            krishna_response=assistant_full_response.strip(),
-                            rag_context=""  # RAG context would be added here if tracked
-                        )
-                        evaluator.print_evaluation(eval_result)
-                    except Exception as e:
-                        print(f"⚠️ Evaluation skipped: {e}")
+                    self._background.put_nowait((self._evaluate_response, (user_text, assistant_full_response.strip())))
                 
                 # Reset for next turn
                 self.metrics['audio_received_at'] = 0
@@ -500,9 +746,7 @@ class StreamingOrchestrator:
             text = await llm_token_buffer.get()
             if text is None: # Handle end of response
                 # End of LLM response
-                await websocket.send(json.dumps({
-                    'type': 'response_complete'
-                }))
+                await websocket.send(_FRAME_RESPONSE_COMPLETE)
                 
                 # Print final metrics
                 self._print_metrics()
@@ -516,50 +760,40 @@ class StreamingOrchestrator:
             try:
                 # Mark as speaking to stop receiving audio (feedback prevention)
                 self.is_speaking = True
-                await websocket.send(json.dumps({
-                    'type': 'state', 
-                    'message': 'Krishna is speaking...', 
-                    'status': 'speaking'
-                }))
+                await websocket.send(_FRAME_SPEAKING)
                 
                 print(f"🔊 TTS generating: {text[:50]}...")
                 
-                # Streaming TTS
+                # Streaming TTS - PCM goes out as binary frames between audio_start/audio_complete
+                await websocket.send(_FRAME_AUDIO_START)
                 first_chunk = True
-                async for chunk in self.tts.stream_audio(text): # Changed from stream to stream_audio
-                    if self.should_interrupt:
-                        print("⚠️ TTS playback interrupted") # Added print for clarity
-                        break
-                    
-                    if first_chunk:
-                        # Metrics for first audio
-                        self.metrics['tts_first_audio_at'] = time.time()
-                        if self.metrics['llm_first_token_at'] > 0:
-                            ttfa = (self.metrics['tts_first_audio_at'] - self.metrics['llm_first_token_at']) * 1000
-                            print(f"⚡ TTS first audio latency (from LLM): {ttfa:.0f}ms")
-                        first_chunk = False
+                async with aclosing(_coalesce_audio(self.tts.stream_audio(text))) as audio:
+                    async for chunk in audio:
+                        if self.should_interrupt:
+                            print("⚠️ TTS playback interrupted") # Added print for clarity
+                            break
                         
-                    import base64
-                    await websocket.send(json.dumps({
-                        'type': 'audio_chunk', # Changed from 'audio' to 'audio_chunk'
-                        'audio': base64.b64encode(chunk).decode('utf-8') # Changed from 'data' to 'audio'
-                    }))
+                        if first_chunk:
+                            # Metrics for first audio
+                            self.metrics['tts_first_audio_at'] = time.monotonic_ns()
+                            if self.metrics['llm_first_token_at'] > 0:
+                                ttfa = (self.metrics['tts_first_audio_at'] - self.metrics['llm_first_token_at']) / 1e6
+                                print(f"⚡ TTS first audio latency (from LLM): {ttfa:.0f}ms")
+                            first_chunk = False
+                            
+                        await websocket.send(chunk)
                 
                 # Signal chunk completion to client
-                await websocket.send(json.dumps({'type': 'audio_complete'}))
+                await websocket.send(_FRAME_AUDIO_COMPLETE)
                 
                 # Removed sleep to eliminate gap between sentences
                 self.is_speaking = False
-                await websocket.send(json.dumps({
-                    'type': 'state', 
-                    'message': 'Krishna finished speaking', 
-                    'status': 'success'
-                }))
+                await websocket.send(_FRAME_FINISHED)
                 
             except Exception as e:
                 print(f"❌ TTS Error: {e}")
                 self.is_speaking = False
-                await websocket.send(json.dumps({'type': 'state', 'state': 'idle'}))
+                await websocket.send(_FRAME_IDLE)
     
     def _build_krishna_context(self, user_text: str) -> str:
         """Build Krishna-style context for LLM"""
@@ -571,8 +805,7 @@ Provide practical spiritual guidance rooted in dharma."""
         # Add conversation history
         messages = [{"role": "system", "content": system_prompt}]
         
-        for msg in self.conversation_history[-4:]:  # Last 4 exchanges
-            messages.append(msg)
+        messages.extend(list(self.conversation_history)[-4:])  # Last 4 exchanges
         
         messages.append({"role": "user", "content": user_text})
         
@@ -583,53 +816,86 @@ Provide practical spiritual guidance rooted in dharma."""
         return text.rstrip().endswith(('.', '!', '?', '।', '\n'))
     
     def _print_metrics(self):
-        """Print performance metrics"""
+        """Queue the performance metrics report (snapshot taken now) for the background worker"""
+        report = self._metrics_report()
+        if report:
+            self._background.put_nowait((print, (report,)))
+    
+    def _metrics_report(self) -> Optional[str]:
+        """Format performance metrics"""
         if self.metrics['audio_received_at'] == 0:
-            return
+            return None
         
-        print("\n" + "="*50)
-        print("📊 PERFORMANCE METRICS")
-        print("="*50)
+        lines = ["\n" + "="*50, "📊 PERFORMANCE METRICS", "="*50]
         
         base = self.metrics['audio_received_at']
         
         if self.metrics['stt_first_partial_at']:
-            stt_latency = (self.metrics['stt_first_partial_at'] - base) * 1000
-            print(f"🎯 STT First Partial: {stt_latency:.0f}ms")
+            stt_latency = (self.metrics['stt_first_partial_at'] - base) / 1e6
+            lines.append(f"🎯 STT First Partial: {stt_latency:.0f}ms")
         
         if self.metrics['llm_first_token_at']:
-            llm_latency = (self.metrics['llm_first_token_at'] - base) * 1000
-            print(f"🧠 LLM First Token: {llm_latency:.0f}ms")
+            llm_latency = (self.metrics['llm_first_token_at'] - base) / 1e6
+            lines.append(f"🧠 LLM First Token: {llm_latency:.0f}ms")
         
         if self.metrics['tts_first_audio_at']:
             # THE "EXCELLENT" METRIC: User stopped speaking -> AI started speaking
-            handoff_latency = (self.metrics['tts_first_audio_at'] - self.processing_start_time) * 1000
-            print(f"⚡ HANDOFF LATENCY: {handoff_latency:.0f}ms (Target: <1500ms)")
+            handoff_latency = (self.metrics['tts_first_audio_at'] - self.processing_start_time) / 1e6
+            lines.append(f"⚡ HANDOFF LATENCY: {handoff_latency:.0f}ms (Target: <1500ms)")
             
             if handoff_latency < 1000:
-                print("🌟 EXCELLENT - Sub-second handoff!")
+                lines.append("🌟 EXCELLENT - Sub-second handoff!")
             elif handoff_latency < 1500:
-                print("✅ GREAT - Very responsive!")
+                lines.append("✅ GREAT - Very responsive!")
             elif handoff_latency < 2500:
-                print("⚠️ GOOD - Feels okay")
+                lines.append("⚠️ GOOD - Feels okay")
             else:
-                print("❌ SLOW - Distance is too far")
+                lines.append("❌ SLOW - Distance is too far")
         
-        print("="*50 + "\n")
+        lines.append("="*50 + "\n")
+        return "\n".join(lines)
+    
+    async def _background_worker(self):
+        """Run evaluation and metrics logging queued by the pipeline, off its critical path"""
+        while True:
+            fn, args = await self._background.get()
+            try:
+                result = fn(*args)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"⚠️ Background job failed: {e}")
+    
+    async def _evaluate_response(self, user_text: str, response: str):
+        """Score a finished response with the evaluator and print the result"""
+        try:
+            evaluator = get_evaluator()
+            eval_result = await evaluator.evaluate(
+                user_query=user_text,
+                krishna_response=response,
+                rag_context=""  # RAG context would be added here if tracked
+            )
+            evaluator.print_evaluation(eval_result)
+        except Exception as e:
+            print(f"⚠️ Evaluation skipped: {e}")
     
     def _reset_metrics(self):
-        """Reset metrics for next interaction"""
-        self.metrics = {
-            'audio_received_at': 0,
-            'stt_first_partial_at': 0,
-            'llm_first_token_at': 0,
-            'tts_first_audio_at': 0,
-            'user_heard_at': 0
-        }
-
-
-async def main():
-    """Start WebSocket server"""
+        """Reset metrics for next interaction (in place, one C-level update)"""
+        self.metrics.update(_METRICS_ZERO)
+
+
+def use_uvloop():
+    """Run asyncio on uvloop (libuv event loop in C) when it is installed - not on Windows"""
+    try:
+        import uvloop
+    except ImportError:
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    print("⚡ Using uvloop event loop")
+
+
+async def main(on_ready=None):
+    """Start WebSocket server; on_ready() is called once it is listening"""
     orchestrator = StreamingOrchestrator()
     
     print("="*60)
@@ -639,13 +905,24 @@ async def main():
     print("🎯 WebSocket server starting on port 8765")
     print("="*60 + "\n")
     
-    async with websockets.serve(orchestrator.handle_client, "0.0.0.0", 8765):
-        print("✅ Server ready! Waiting for connections...\n")
-        await asyncio.Future()  # Run forever
+    await orchestrator.warm_up()
+    
+    try:
+        # No permessage-deflate: PCM barely compresses, so zlib would just burn CPU per frame
+        async with websockets.serve(orchestrator.handle_client, "0.0.0.0", 8765, compression=None):
+            print("✅ Server ready! Waiting for connections...\n")
+            if on_ready:
+                on_ready()
+            await asyncio.Future()  # Run forever
+    finally:
+        await orchestrator.tts.aclose()
+        if EVALUATION_ENABLED:
+            await close_evaluator()
 
 
 if __name__ == "__main__":
     try:
+        use_uvloop()
         print("DEBUG: Calling asyncio.run(main())")
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -5,42 +5,103 @@ Target: <400ms latency for first partial
 
 import asyncio
 import io
+import re
+import struct
 import time
-import wave
 from typing import Optional
+import numpy as np
 from openai import AsyncOpenAI
 from config import Config
 
+try:
+    import webrtcvad
+except ImportError:
+    webrtcvad = None  # Energy-only partial gate
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None  # Groq uploads stay WAV
+
+
+# Canonical 44-byte PCM WAV header. Bytes 8-40 ("WAVE", the fmt chunk and "data")
+# are fixed by Config; only the RIFF and data sizes around them change per call
+_WAV_FIXED = struct.pack(
+    '<4s4sIHHIIHH4s',
+    b'WAVE', b'fmt ', 16,
+    1,                                           # PCM
+    Config.CHANNELS, Config.SAMPLE_RATE,
+    Config.SAMPLE_RATE * Config.CHANNELS * 2,    # byte rate (16-bit)
+    Config.CHANNELS * 2, 16,                     # block align, bits per sample
+    b'data',
+)
+_WAV_HEADER = struct.Struct('<4sI32sI')
+
+
+def _wrap_wav(pcm_bytes: bytes) -> bytes:
+    """Wrap raw PCM bytes in a WAV header (no wave/BytesIO round-trip)"""
+    n = len(pcm_bytes)
+    return _WAV_HEADER.pack(b'RIFF', 36 + n, _WAV_FIXED, n) + pcm_bytes
+
+
+# Whole-transcript Whisper artifacts on silence/noise, tolerant of case, punctuation,
+# brackets and small variants ("thank you for watching!", "[Music]", "(inaudible)")
+_HALLUCINATION_RE = re.compile(
+    r'^\W*(?:obrigado|pronto|arigato|thanks?(?: you)? for watching|subtitles by\b.*|hindi|english'
+    r'|please (?:like (?:and )?)?subscribe|unintelligible|inaudible|music|thank you|bye|hey)\W*$',
+    re.IGNORECASE,
+)
+
+
+# Partial gate: 30ms frames (the webrtcvad frame size) over the last 600ms
+_VAD_FRAME_SAMPLES = Config.SAMPLE_RATE * 30 // 1000
+_VAD_TAIL_FRAMES = 20
+_VAD_MIN_VOICED = 3
+
+
+def _has_speech(audio_bytes: bytes, vad=None) -> bool:
+    """
+    Cheap local check that the tail of the utterance contains speech
+    Frames must pass an RMS floor first; webrtcvad (when installed) then confirms them
+    """
+    samples = np.frombuffer(audio_bytes, dtype='<i2')
+    n_frames = min(len(samples) // _VAD_FRAME_SAMPLES, _VAD_TAIL_FRAMES)
+    if n_frames < _VAD_MIN_VOICED:
+        return True  # Too short to judge - let the STT decide
+    
+    tail = samples[len(samples) - n_frames * _VAD_FRAME_SAMPLES:].reshape(n_frames, _VAD_FRAME_SAMPLES)
+    rms = np.sqrt(np.square(tail, dtype=np.float32).mean(axis=1))
+    loud = np.flatnonzero(rms >= Config.PARTIAL_VAD_MIN_RMS)
+    if len(loud) < _VAD_MIN_VOICED:
+        return False
+    if vad is None:
+        return True
+    
+    voiced = 0
+    for i in loud:
+        if vad.is_speech(tail[i].tobytes(), Config.SAMPLE_RATE):
+            voiced += 1
+            if voiced >= _VAD_MIN_VOICED:
+                return True
+    return False
+
 
 class OpenAIStreamingSTT:
     """Streaming STT with partial and final transcripts (using OpenAI)"""
     
     def __init__(self):
         self.client = AsyncOpenAI(api_key=Config.OPENAI_API_KEY)
-        self.last_partial = ""
     
-    def _wrap_wav(self, pcm_bytes: bytes) -> bytes:
-        """Wrap raw PCM bytes in a WAV header"""
-        with io.BytesIO() as wav_io:
-            with wave.open(wav_io, 'wb') as wav_file:
-                wav_file.setnchannels(Config.CHANNELS)
-                wav_file.setsampwidth(2) # 16-bit
-                wav_file.setframerate(Config.SAMPLE_RATE)
-                wav_file.writeframes(pcm_bytes)
-            return wav_io.getvalue()
-
     async def transcribe_partial(self, audio_bytes: bytes) -> Optional[str]:
         """Get partial transcript from audio chunk"""
         try:
             # Wrap in WAV header
-            wav_data = self._wrap_wav(audio_bytes)
-            audio_file = io.BytesIO(wav_data)
-            audio_file.name = "audio.wav"
+            wav_data = _wrap_wav(audio_bytes)
             
             start = time.time()
             response = await self.client.audio.transcriptions.create(
                 model=Config.WHISPER_MODEL,
-                file=audio_file,
+                file=("audio.wav", wav_data, "audio/wav"),
                 # Force language to Hindi to prevent detecting other scripts
                 language="hi",
                 # Context-rich prompt biased towards Krishna/Gita
@@ -51,9 +112,8 @@ class OpenAIStreamingSTT:
             elapsed = (time.time() - start) * 1000
             text = response.strip() if isinstance(response, str) else response.text.strip()
             
-            if text and text != self.last_partial:
+            if text:
                 print(f"⚡ STT partial ({elapsed:.0f}ms): {text}")
-                self.last_partial = text
                 return text
             
             return None
@@ -64,14 +124,12 @@ class OpenAIStreamingSTT:
     async def transcribe_final(self, audio_bytes: bytes) -> Optional[str]:
         """Get final transcript from complete audio"""
         try:
-            wav_data = self._wrap_wav(audio_bytes)
-            audio_file = io.BytesIO(wav_data)
-            audio_file.name = "audio.wav"
+            wav_data = _wrap_wav(audio_bytes)
             
             start = time.time()
             response = await self.client.audio.transcriptions.create(
                 model=Config.WHISPER_MODEL,
-                file=audio_file,
+                file=("audio.wav", wav_data, "audio/wav"),
                 response_format="verbose_json",
                 temperature=0.0,
                 language="hi",
@@ -81,14 +139,10 @@ class OpenAIStreamingSTT:
             elapsed = (time.time() - start) * 1000
             text = response.text.strip()
             print(f"✅ STT final ({elapsed:.0f}ms): {text}")
-            self.last_partial = ""
             return text
         except Exception as e:
             print(f"❌ STT final error: {e}")
             return None
-    
-    def reset(self):
-        self.last_partial = ""
 
 
 class GroqStreamingSTT:
@@ -97,38 +151,47 @@ class GroqStreamingSTT:
     def __init__(self):
         from groq import AsyncGroq
         self.client = AsyncGroq(api_key=Config.GROQ_API_KEY)
-        self.last_partial = ""
+        # FLAC is lossless and roughly half the upload of WAV; turned off if Groq ever rejects it
+        self.use_flac = soundfile is not None and Config.STT_UPLOAD_FLAC
+    
+    def _upload(self, pcm_bytes: bytes) -> tuple:
+        """
+        (filename, body, content type) for the transcription request
+        The body is built whole, after end of speech: Whisper only starts once the file is
+        complete, so streaming the upload during capture would need an open-ended WAV size
+        and chunked multipart (neither API documents either) to save a ~20-50ms upload.
+        FLAC halving the bytes is the cheaper win.
+        """
+        if self.use_flac:
+            buf = io.BytesIO()
+            soundfile.write(buf, np.frombuffer(pcm_bytes, dtype='<i2'), Config.SAMPLE_RATE,
+                            format='FLAC', subtype='PCM_16')
+            return ("audio.flac", buf.getvalue(), "audio/flac")
+        return ("audio.wav", _wrap_wav(pcm_bytes), "audio/wav")
+    
+    def _check_format_rejected(self, e: Exception):
+        """A 400 while uploading FLAC: use WAV from now on"""
+        if self.use_flac and getattr(e, 'status_code', None) == 400:
+            print("⚠️ Groq rejected FLAC upload - switching to WAV")
+            self.use_flac = False
     
-    def _wrap_wav(self, pcm_bytes: bytes) -> bytes:
-        """Wrap raw PCM bytes in a WAV header"""
-        with io.BytesIO() as wav_io:
-            with wave.open(wav_io, 'wb') as wav_file:
-                wav_file.setnchannels(Config.CHANNELS)
-                wav_file.setsampwidth(2) # 16-bit
-                wav_file.setframerate(Config.SAMPLE_RATE)
-                wav_file.writeframes(pcm_bytes)
-            return wav_io.getvalue()
-
     async def transcribe_partial(self, audio_bytes: bytes) -> Optional[str]:
         """Get partial transcript using Groq Whisper (Optimized window)"""
         try:
             # ONLY SEND LAST 3 SECONDS FOR PARTIALS TO REDUCE LATENCY
-            # 16000 samples/sec * 2 bytes/sample = 32000 bytes/sec
-            window_size = 32000 * 3 
-            audio_window = audio_bytes[-window_size:] if len(audio_bytes) > window_size else audio_bytes
+            # (the server already snapshots just this window; the view makes it a no-op then)
+            audio_window = memoryview(audio_bytes)[-Config.PARTIAL_WINDOW_BYTES:]
 
-            wav_data = self._wrap_wav(audio_window)
-            audio_file = io.BytesIO(wav_data)
-            audio_file.name = "audio.wav"
+            upload = self._upload(audio_window)
             
             start = time.time()
-            print(f"📡 Groq STT partial starting (Window: {len(audio_window)} bytes)...")
+            print(f"📡 Groq STT partial starting (Window: {len(audio_window)} bytes, upload: {len(upload[1])})...")
             
             # Using asyncio.wait_for for robust timeout
             response = await asyncio.wait_for(
                 self.client.audio.transcriptions.create(
                     model="whisper-large-v3",
-                    file=("audio.wav", audio_file),
+                    file=upload,
                     response_format="text",
                     prompt="Hindi, Hinglish, English conversation. User is speaking in Hindi or English."
                 ),
@@ -138,9 +201,8 @@ class GroqStreamingSTT:
             elapsed = (time.time() - start) * 1000
             text = response.strip()
             
-            if text and text != self.last_partial:
+            if text:
                 print(f"⚡ Groq STT partial ({elapsed:.0f}ms): {text}")
-                self.last_partial = text
                 return text
             
             return None
@@ -149,22 +211,21 @@ class GroqStreamingSTT:
             raise
         except Exception as e:
             print(f"❌ Groq STT partial error ({type(e).__name__}): {e}")
+            self._check_format_rejected(e)
             raise
     
     async def transcribe_final(self, audio_bytes: bytes) -> Optional[str]:
         """Get final transcript using Groq Whisper"""
         try:
-            wav_data = self._wrap_wav(audio_bytes)
-            audio_file = io.BytesIO(wav_data)
-            audio_file.name = "audio.wav"
+            upload = self._upload(audio_bytes)
             
             start = time.time()
-            print(f"📡 Groq STT final starting ({len(audio_bytes)} bytes)...")
+            print(f"📡 Groq STT final starting ({len(audio_bytes)} bytes, upload: {len(upload[1])})...")
             
             response = await asyncio.wait_for(
                 self.client.audio.transcriptions.create(
                     model="whisper-large-v3",
-                    file=("audio.wav", audio_file),
+                    file=upload,
                     response_format="json",
                     temperature=0.0,
                     prompt="Hindi, Hinglish, English conversation. Transcribe speech in Hindi or English only."
@@ -188,26 +249,18 @@ class GroqStreamingSTT:
             print(f"✅ Groq STT final ({elapsed:.0f}ms): {text}")
             
             # HALLUCINATION FILTER: Ignore common Whisper artifacts
-            hallucinations = {
-                "Obrigado.", "Pronto.", "Arigato.", "Thanks for watching!", 
-                "Subtitles by", "Hindi", "English", "Please subscribe", 
-                "unintelligible", "inaudible", "Thank you.", "Bye.", "Hey."
-            }
-            if text in hallucinations or len(text.strip()) < 2:
+            if len(text.strip()) < 2 or _HALLUCINATION_RE.match(text):
                 print(f"⚠️ Ignored potential STT hallucination/junk: '{text}'")
                 return None
 
-            self.last_partial = ""
             return text
         except asyncio.TimeoutError:
             print(f"❌ Groq STT final timeout (>7s)")
             raise
         except Exception as e:
             print(f"❌ Groq STT final error ({type(e).__name__}): {e}")
+            self._check_format_rejected(e)
             raise
-    
-    def reset(self):
-        self.last_partial = ""
 
 
 class FallbackStreamingSTT:
@@ -217,9 +270,14 @@ class FallbackStreamingSTT:
         self.groq = GroqStreamingSTT() if Config.GROQ_API_KEY else None
         self.openai = OpenAIStreamingSTT() if Config.OPENAI_API_KEY else None
         self.consecutive_groq_failures = 0
-        self.last_partial = ""
+        self._vad = webrtcvad.Vad(2) if webrtcvad else None
+        self._final_latency = {}  # provider -> EWMA of successful final latency (seconds)
 
     async def transcribe_partial(self, audio_bytes: bytes) -> Optional[str]:
+        # Silence/pause ticks never reach the network
+        if not _has_speech(audio_bytes, self._vad):
+            return None
+        
         # If Groq is failing repeatedly, skip it for a bit
         if self.groq and self.consecutive_groq_failures < 3:
             try:
@@ -235,27 +293,86 @@ class FallbackStreamingSTT:
         return None
 
     async def transcribe_final(self, audio_bytes: bytes) -> Optional[str]:
-        # Always try Groq first but with a tight timeout (already in GroqStreamingSTT)
-        if self.groq:
-            try:
-                text = await self.groq.transcribe_final(audio_bytes)
+        """
+        Groq first; OpenAI starts as soon as Groq fails or runs past its usual latency,
+        and the first usable transcript wins (the other request is cancelled)
+        """
+        if not (self.groq and self.openai):
+            stt = self.groq or self.openai
+            if stt is None:
+                return None
+            return await self._final_or_none(stt, audio_bytes)
+        
+        tasks = {asyncio.create_task(self._timed_final("groq", audio_bytes)): "groq"}
+        try:
+            # Adaptive hedge delay: 1.5x Groq's recent final latency once we have one
+            ewma = self._final_latency.get("groq")
+            hedge_after = 1.5 * ewma if ewma else Config.STT_FINAL_HEDGE_MS / 1000
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if done:
+                text = self._final_result(done.pop(), tasks)
                 if text:
-                    self.consecutive_groq_failures = 0
                     return text
-            except Exception as e:
-                print(f"⚠️ Groq final failed/timed out, falling back to OpenAI: {e}")
-                self.consecutive_groq_failures += 1
-
-        if self.openai:
-            print("📡 Trying OpenAI Whisper (Fallback)...")
-            return await self.openai.transcribe_final(audio_bytes)
-        
-        return None
+                print("📡 Trying OpenAI Whisper (Fallback)...")
+            else:
+                print(f"📡 Groq final slower than {hedge_after * 1000:.0f}ms - hedging with OpenAI Whisper...")
+            tasks[asyncio.create_task(self._timed_final("openai", audio_bytes))] = "openai"
+            
+            pending = {task for task in tasks if not task.done()}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    text = self._final_result(task, tasks)
+                    if text:
+                        return text
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _timed_final(self, provider: str, audio_bytes: bytes) -> Optional[str]:
+        """transcribe_final on one provider, folding its latency into the EWMA on success"""
+        start = time.monotonic()
+        text = await getattr(self, provider).transcribe_final(audio_bytes)
+        if text:
+            elapsed = time.monotonic() - start
+            previous = self._final_latency.get(provider)
+            self._final_latency[provider] = elapsed if previous is None else 0.8 * previous + 0.2 * elapsed
+        return text
+    
+    def _final_result(self, task: asyncio.Task, tasks: dict) -> Optional[str]:
+        """Text of a finished final task, or None if it failed / heard nothing usable"""
+        provider = tasks[task]
+        try:
+            text = task.result()
+        except Exception as e:
+            print(f"⚠️ {provider} final failed/timed out: {e}")
+            text = None
+        if provider == "groq":
+            self.consecutive_groq_failures = 0 if text else self.consecutive_groq_failures + 1
+        return text
+    
+    @staticmethod
+    async def _final_or_none(stt, audio_bytes: bytes) -> Optional[str]:
+        try:
+            return await stt.transcribe_final(audio_bytes)
+        except Exception as e:
+            print(f"⚠️ STT final failed: {e}")
+            return None
 
     def reset(self):
-        if self.groq: self.groq.reset()
-        if self.openai: self.openai.reset()
         self.consecutive_groq_failures = 0
+    
+    async def warm(self):
+        """Open the provider connections (TLS + HTTP/2) with a cheap request each"""
+        async def ping(name, client):
+            try:
+                await client.models.list()
+            except Exception as e:
+                print(f"⚠️ {name} STT warm-up failed: {e}")
+        
+        await asyncio.gather(*(ping(name, stt.client) for name, stt in
+                               (("Groq", self.groq), ("OpenAI", self.openai)) if stt))
 
 
 # Default to the robust fallback version
@@ -4,15 +4,52 @@ Target: First audio <500ms
 """
 
 import asyncio
+import hashlib
 import io
+import os
+import re
 import time
 import json
 import httpx
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from typing import AsyncGenerator, Optional
 from openai import AsyncOpenAI
 from config import Config
-from dotenv import load_dotenv
-load_dotenv()
+
+try:
+    from elevenlabs import VoiceSettings
+    from elevenlabs.client import ElevenLabs
+except ImportError:
+    ElevenLabs = None  # generate_full_audio falls back to OpenAI
+
+
+def _make_http_client() -> httpx.AsyncClient:
+    """Shared keep-alive client for ElevenLabs (HTTP/2 when the h2 package is installed)"""
+    limits = httpx.Limits(max_keepalive_connections=8, keepalive_expiry=60)
+    timeout = httpx.Timeout(30.0, connect=2.0)
+    try:
+        return httpx.AsyncClient(http2=True, limits=limits, timeout=timeout)
+    except ImportError:
+        return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+
+# ElevenLabs PCM is re-chunked to at least this many bytes after the first chunk
+_PCM_BATCH_BYTES = 4096
+
+# Sentence end + trailing whitespace, kept as its own split item so it can be re-attached
+_SENTENCE_SPLIT = re.compile(r'([.!?।]\s+)')
+
+
+def _pcm24k_to_16k(pcm: bytes) -> bytes:
+    """Resample 24kHz int16 PCM (a multiple of 3 samples) to the 16kHz the clients play"""
+    x = np.frombuffer(pcm, dtype='<i2').reshape(-1, 3).astype(np.int32)
+    out = np.empty((len(x), 2), dtype='<i2')
+    out[:, 0] = x[:, 0]
+    out[:, 1] = (x[:, 1] + x[:, 2]) >> 1  # sample at t=1.5
+    return out.tobytes()
 
 
 class StreamingTTS:
@@ -24,6 +61,19 @@ class StreamingTTS:
         self.elevenlabs_voice_id = Config.ELEVENLABS_VOICE_ID
         self.use_elevenlabs = bool(self.elevenlabs_api_key)
         
+        # Reused across utterances so only the first one pays the TCP+TLS handshake
+        self._http = _make_http_client()
+        
+        # Blocking SDK client for generate_full_audio, on its own threads so it never
+        # queues behind (or starves) other to_thread work in the default executor
+        self.elevenlabs_client = None
+        if self.use_elevenlabs and ElevenLabs is not None:
+            try:
+                self.elevenlabs_client = ElevenLabs(api_key=self.elevenlabs_api_key)
+            except Exception as e:
+                print(f"⚠️ ElevenLabs SDK client unavailable: {e}")
+        self._tts_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tts-gen")
+        
         # Always initialize OpenAI as fallback if key exists
         if Config.OPENAI_API_KEY:
             self.openai_client = AsyncOpenAI(api_key=Config.OPENAI_API_KEY)
@@ -39,26 +89,103 @@ class StreamingTTS:
             print("❌ No TTS API keys found! Please check your .env file.")
             self.provider = "None"
     
-    async def stream_audio(self, text: str) -> AsyncGenerator[bytes, None]:
+    async def warm(self):
+        """Open the provider connections (TLS + HTTP/2) so the first sentence skips the handshake"""
+        async def ping(name, request):
+            try:
+                await request
+            except Exception as e:
+                print(f"⚠️ {name} TTS warm-up failed: {e}")
+        
+        requests = []
+        if self.use_elevenlabs:
+            requests.append(ping("ElevenLabs", self._http.get(
+                "https://api.elevenlabs.io/v1/models", headers={"xi-api-key": self.elevenlabs_api_key})))
+        if hasattr(self, 'openai_client'):
+            requests.append(ping("OpenAI", self.openai_client.models.list()))
+        await asyncio.gather(*requests)
+    
+    async def aclose(self) -> None:
+        """Close the pooled HTTP connections and the SDK worker threads"""
+        await self._http.aclose()
+        self._tts_pool.shutdown(wait=False)
+    
+    async def stream_audio(self, text: str, outcome: Optional[dict] = None) -> AsyncGenerator[bytes, None]:
         """
         Stream audio chunks for given text
         Args:
             text: Text to convert to speech
+            outcome: Optional dict filled in as the stream runs - "provider" ("elevenlabs" /
+                "openai") once a provider streamed to the end, "failed" if any provider errored
         Yields:
             Audio chunks
         """
         if not text.strip():
             return
+        if outcome is None:
+            outcome = {}
         
-        if self.use_elevenlabs:
-            async for chunk in self._stream_elevenlabs(text):
+        if self.use_elevenlabs and Config.HEDGE_TTS and hasattr(self, 'openai_client'):
+            async for chunk in self._stream_hedged(text, outcome):
+                yield chunk
+        elif self.use_elevenlabs:
+            async for chunk in self._stream_elevenlabs(text, outcome=outcome):
                 yield chunk
         elif hasattr(self, 'openai_client'):
-            async for chunk in self._stream_openai(text):
+            async for chunk in self._stream_openai(text, outcome):
+                yield chunk
+    
+    async def _stream_hedged(self, text: str, outcome: dict) -> AsyncGenerator[bytes, None]:
+        """
+        ElevenLabs with a delayed OpenAI hedge request
+        Whichever provider yields audio first is streamed; the other one is cancelled
+        """
+        outcomes = {"ElevenLabs": {}, "OpenAI": {}}  # Only the winner's is reported
+        
+        async def openai_after_head_start():
+            await asyncio.sleep(Config.TTS_HEDGE_DELAY_MS / 1000)
+            async for chunk in self._stream_openai(text, outcomes["OpenAI"]):
+                yield chunk
+        
+        sources = {"ElevenLabs": self._stream_elevenlabs(text, fallback=False, outcome=outcomes["ElevenLabs"]),
+                   "OpenAI": openai_after_head_start()}
+        firsts = {asyncio.ensure_future(anext(gen, None)): (name, gen) for name, gen in sources.items()}
+        winner = None
+        try:
+            while firsts and winner is None:
+                done, _ = await asyncio.wait(firsts, return_when=asyncio.FIRST_COMPLETED)
+                for fut in done:
+                    name, gen = firsts.pop(fut)
+                    chunk = fut.result()
+                    if chunk is not None and winner is None:
+                        winner = (name, gen, chunk)
+                    else:
+                        await gen.aclose()  # Failed (no audio) or lost a tie
+        finally:
+            for fut, (name, gen) in firsts.items():
+                fut.cancel()
+                await asyncio.wait({fut})
+                await gen.aclose()
+        
+        if winner is None:
+            outcome["failed"] = True
+            return
+        name, gen, chunk = winner
+        if name != "ElevenLabs":
+            print(f"🏁 TTS hedge: {name} answered first")
+        try:
+            yield chunk
+            async for chunk in gen:
                 yield chunk
+        finally:
+            await gen.aclose()
+        outcome.update(outcomes[name])
     
-    async def _stream_elevenlabs(self, text: str) -> AsyncGenerator[bytes, None]:
+    async def _stream_elevenlabs(self, text: str, fallback: bool = True,
+                                 outcome: Optional[dict] = None) -> AsyncGenerator[bytes, None]:
         """Stream audio using ElevenLabs REST API (Fastest & most robust)"""
+        if outcome is None:
+            outcome = {}
         try:
             start = time.time()
             url = f"https://api.elevenlabs.io/v1/text-to-speech/{self.elevenlabs_voice_id}/stream"
@@ -83,40 +210,64 @@ class StreamingTTS:
             # Using 16kHz PCM for low latency and easy decoding
             params = {"output_format": "pcm_16000"}
             
-            async with httpx.AsyncClient() as client:
-                async with client.stream("POST", url, json=data, headers=headers, params=params, timeout=30.0) as response:
-                    if response.status_code != 200:
-                        error_text = await response.aread()
-                        raise Exception(f"ElevenLabs API Error {response.status_code}: {error_text.decode()}")
+            async with self._http.stream("POST", url, json=data, headers=headers, params=params) as response:
+                if response.status_code != 200:
+                    # Bounded read of the error body - a stalled error response must not
+                    # hold the turn for the whole request timeout
+                    try:
+                        error_text = (await asyncio.wait_for(response.aread(), timeout=1.0))[:512]
+                    except (asyncio.TimeoutError, httpx.HTTPError):
+                        error_text = b"<no body>"
+                    raise Exception(f"ElevenLabs API Error {response.status_code}: {error_text.decode(errors='replace')}")
+                
+                first_chunk = True
+                chunk_count = 0
+                pending = bytearray()
+                
+                async for chunk in response.aiter_bytes():
+                    # First audio goes out at once (TTFB); after that batch to >= 4 KiB.
+                    # Always whole int16 samples - an odd trailing byte waits for the next chunk
+                    pending += chunk
+                    if not first_chunk and len(pending) < _PCM_BATCH_BYTES:
+                        continue
+                    usable = len(pending) & ~1
+                    if not usable:
+                        continue
                     
-                    first_chunk = True
-                    chunk_count = 0
+                    if first_chunk:
+                        latency = (time.time() - start) * 1000
+                        print(f"⚡ ElevenLabs (REST) first chunk: {latency:.0f}ms")
+                        first_chunk = False
                     
-                    async for chunk in response.aiter_bytes():
-                        if first_chunk:
-                            latency = (time.time() - start) * 1000
-                            print(f"⚡ ElevenLabs (REST) first chunk: {latency:.0f}ms")
-                            first_chunk = False
-                        
-                        chunk_count += 1
-                        yield chunk
+                    chunk_count += 1
+                    yield bytes(pending[:usable])
+                    del pending[:usable]
+                
+                if len(pending) > 1:
+                    chunk_count += 1
+                    yield bytes(pending[:len(pending) & ~1])
             
             total_time = (time.time() - start) * 1000
             print(f"✅ ElevenLabs (REST) complete: {chunk_count} chunks in {total_time:.0f}ms")
+            outcome["provider"] = "elevenlabs"
             
         except Exception as e:
             print(f"❌ ElevenLabs REST error: {e}")
+            outcome["failed"] = True
             # If quota exceeded or unauthorized, stop trying for this session
             if "quota_exceeded" in str(e).lower() or "401" in str(e):
                 print("⚠️ Switching to OpenAI TTS for the rest of this session...")
                 self.use_elevenlabs = False
                 
-            if hasattr(self, 'openai_client'):
-                async for chunk in self._stream_openai(text):
+            if fallback and hasattr(self, 'openai_client'):
+                async for chunk in self._stream_openai(text, outcome):
                     yield chunk
     
-    async def _stream_openai(self, text: str) -> AsyncGenerator[bytes, None]:
+    async def _stream_openai(self, text: str, outcome: Optional[dict] = None) -> AsyncGenerator[bytes, None]:
         """Stream audio using OpenAI TTS (Low Latency)"""
+        if outcome is None:
+            outcome = {}
+        pending = bytearray()  # 24kHz bytes not yet a whole 3-sample group
         try:
             start = time.time()
             async with self.openai_client.audio.speech.with_streaming_response.create(
@@ -128,41 +279,47 @@ class StreamingTTS:
             ) as response:
                 first_chunk = True
                 async for chunk in response.iter_bytes(chunk_size=4096):
+                    # OpenAI "pcm" is 24kHz; resample to match ElevenLabs' pcm_16000
+                    pending += chunk
+                    usable = len(pending) // 6 * 6
+                    if not usable:
+                        continue
+                    audio = _pcm24k_to_16k(pending[:usable])
+                    del pending[:usable]
+                    
                     if first_chunk:
                         latency = (time.time() - start) * 1000
                         print(f"⚡ OpenAI TTS first chunk: {latency:.0f}ms")
                         first_chunk = False
-                    yield chunk
+                    yield audio
+            outcome["provider"] = "openai"
             
         except Exception as e:
             print(f"❌ OpenAI TTS error: {e}")
+            outcome["failed"] = True
     
     async def generate_full_audio(self, text: str) -> Optional[bytes]:
         """Generate complete audio (non-streaming)"""
         try:
-            if self.use_elevenlabs:
+            if self.use_elevenlabs and self.elevenlabs_client is not None:
                 def generate_audio():
-                    # generate returns an iterator of bytes even if stream=False in some versions, 
-                    # but usually it returns the full bytes if stream=False.
-                    return self.elevenlabs_client.generate(
+                    # convert() returns an iterator of bytes; draining it is the blocking
+                    # network read, so it happens here on the pool thread too
+                    return b''.join(self.elevenlabs_client.text_to_speech.convert(
+                        voice_id=self.elevenlabs_voice_id,
                         text=text,
-                        voice=self.elevenlabs_voice_id,
-                        model=Config.ELEVENLABS_MODEL,
-                        stream=False,
+                        model_id=Config.ELEVENLABS_MODEL,
                         output_format="pcm_16000",
-                        voice_settings={
-                            "stability": Config.ELEVENLABS_STABILITY,
-                            "similarity_boost": Config.ELEVENLABS_SIMILARITY,
-                            "style": Config.ELEVENLABS_STYLE,
-                            "use_speaker_boost": Config.ELEVENLABS_SPEAKER_BOOST
-                        }
-                    )
+                        voice_settings=VoiceSettings(
+                            stability=Config.ELEVENLABS_STABILITY,
+                            similarity_boost=Config.ELEVENLABS_SIMILARITY,
+                            style=Config.ELEVENLABS_STYLE,
+                            use_speaker_boost=Config.ELEVENLABS_SPEAKER_BOOST
+                        )
+                    ))
                 
-                loop = asyncio.get_event_loop()
-                result = await loop.run_in_executor(None, generate_audio)
-                if isinstance(result, bytes):
-                    return result
-                return b''.join(result) # Handle generator if returned
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._tts_pool, generate_audio)
             elif hasattr(self, 'openai_client'):
                 response = await self.openai_client.audio.speech.create(
                     model="tts-1",
@@ -185,7 +342,22 @@ class OptimizedStreamingTTS(StreamingTTS):
     
     def __init__(self):
         super().__init__()
-        self.cache = {}  # Cache common phrases
+        # Two-tier phrase cache: in-memory LRU in front of one .pcm file per phrase,
+        # both bounded by bytes (least recently used first in each OrderedDict)
+        self.cache = OrderedDict()  # key -> PCM bytes
+        self._cache_bytes = 0
+        self._disk = OrderedDict()  # key -> file size
+        self._disk_bytes = 0
+        self._requests = OrderedDict()  # key -> times requested, for cache admission
+        self._cache_dir = None
+        if Config.TTS_CACHE_DIR:
+            try:
+                self._cache_dir = Path(Config.TTS_CACHE_DIR)
+                self._cache_dir.mkdir(parents=True, exist_ok=True)
+                self._scan_disk_cache()
+            except OSError as e:
+                print(f"⚠️ TTS disk cache disabled: {e}")
+                self._cache_dir = None
     
     async def stream_audio(self, text: str) -> AsyncGenerator[bytes, None]:
         """
@@ -199,52 +371,190 @@ class OptimizedStreamingTTS(StreamingTTS):
         if not text:
             return
         
-        # Check cache
-        if text in self.cache:
-            print(f"💾 Cache hit: {text[:30]}...")
-            yield self.cache[text]
+        if len(text) <= 100:
+            async for audio in self._stream_cached(text):
+                yield audio
             return
         
-        # For long text, split into smaller chunks
-        if len(text) > 100:
-            chunks = self._split_into_chunks(text)
-            for chunk in chunks:
-                async for audio in super().stream_audio(chunk):
+        # For long text, split into smaller chunks (each one cacheable on its own) and
+        # pipeline them: the next piece is generating while the current one plays
+        pieces = self._split_into_chunks(text)
+        queues = [asyncio.Queue() for _ in pieces]
+        tasks = []
+        
+        def start(k):
+            if k < len(pieces):
+                tasks.append(asyncio.create_task(self._produce(pieces[k], queues[k])))
+        
+        try:
+            start(0)
+            start(1)  # At most 2 requests in flight (ElevenLabs concurrency limits)
+            for k, queue in enumerate(queues):
+                while (audio := await queue.get()) is not None:
                     yield audio
-        else:
-            # Generate normally
-            audio_chunks = []
+                start(k + 2)
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _produce(self, text: str, queue: asyncio.Queue) -> None:
+        """Pipeline stage: stream one piece into its queue, None-terminated"""
+        try:
+            async for audio in self._stream_cached(text):
+                queue.put_nowait(audio)
+        except Exception as e:
+            print(f"❌ TTS piece error: {e}")
+        finally:
+            queue.put_nowait(None)
+    
+    async def _stream_cached(self, text: str) -> AsyncGenerator[bytes, None]:
+        """Serve text from the cache in one chunk, or stream it and cache the result"""
+        if len(text) > Config.TTS_CACHE_MAX_CHARS:
             async for chunk in super().stream_audio(text):
-                audio_chunks.append(chunk)
                 yield chunk
-            
-            # Cache if small enough
-            if len(text) < 50:
-                self.cache[text] = b''.join(audio_chunks)
+            return
+        
+        key = self._cache_key(text, "elevenlabs" if self.use_elevenlabs else "openai")
+        audio = self._cache_get(key)
+        if audio is not None:
+            print(f"💾 Cache hit: {text[:30]}...")
+            yield audio
+            return
+        admit = self._count_request(key)
+        
+        audio_chunks = []
+        outcome = {}
+        async for chunk in super().stream_audio(text, outcome):
+            audio_chunks.append(chunk)
+            yield chunk
+        
+        # Only reached when the stream ran to completion (an interrupt closes us at the yield).
+        # Cache clean single-provider audio only, under the voice that actually spoke it -
+        # a hedge win, fallback or cut-off stream must not replay for this phrase forever
+        if admit and audio_chunks and outcome.get("provider") and not outcome.get("failed"):
+            self._cache_put(self._cache_key(text, outcome["provider"]), b''.join(audio_chunks))
+    
+    def _cache_key(self, text: str, provider: str) -> str:
+        """
+        Hash of the normalized text plus everything that changes how it sounds
+        Normalization only folds case and whitespace: the audio must still say exactly
+        these words, so near-duplicates (semantic matches) are deliberately not merged
+        """
+        if provider == "elevenlabs":
+            voice = (f"elevenlabs|{self.elevenlabs_voice_id}|{Config.ELEVENLABS_MODEL}|"
+                     f"{Config.ELEVENLABS_STABILITY}|{Config.ELEVENLABS_SIMILARITY}|"
+                     f"{Config.ELEVENLABS_STYLE}|{Config.ELEVENLABS_SPEAKER_BOOST}")
+        else:
+            voice = f"openai|tts-1|{Config.OPENAI_VOICE}"
+        normalized = " ".join(text.lower().split())
+        return hashlib.sha256(f"{normalized}|{voice}".encode()).hexdigest()
+    
+    def _count_request(self, key: str) -> bool:
+        """Note a cache miss; True once the phrase was asked for TTS_CACHE_ADMIT_AFTER times"""
+        count = self._requests.pop(key, 0) + 1
+        self._requests[key] = count
+        if len(self._requests) > 4096:
+            self._requests.popitem(last=False)
+        return count >= Config.TTS_CACHE_ADMIT_AFTER
+    
+    def _scan_disk_cache(self) -> None:
+        """Index the files left by earlier runs, oldest (least recently used) first"""
+        entries = []
+        for path in self._cache_dir.glob("*.pcm"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, path.stem, st.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+    
+    def _cache_get(self, key: str) -> Optional[bytes]:
+        """Memory first, then disk (promoting disk hits into memory)"""
+        audio = self.cache.get(key)
+        if audio is not None:
+            self.cache.move_to_end(key)
+            return audio
+        if self._cache_dir is None:
+            return None
+        path = self._cache_dir / f"{key}.pcm"
+        try:
+            audio = path.read_bytes()
+            os.utime(path)  # mtime = last use, so the LRU order survives restarts
+        except OSError:
+            self._forget_disk(key)  # Evicted (possibly by another worker)
+            return None
+        if key in self._disk:
+            self._disk.move_to_end(key)
+        self._remember(key, audio)
+        return audio
+    
+    def _cache_put(self, key: str, audio: bytes) -> None:
+        self._remember(key, audio)
+        if self._cache_dir is None:
+            return
+        path = self._cache_dir / f"{key}.pcm"
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            tmp.write_bytes(audio)
+            os.replace(tmp, path)  # Atomic - readers never see a half-written file
+        except OSError as e:
+            print(f"⚠️ TTS cache write failed: {e}")
+            return
+        self._forget_disk(key)
+        self._disk[key] = len(audio)
+        self._disk_bytes += len(audio)
+        self._evict_disk()
+    
+    def _forget_disk(self, key: str) -> None:
+        self._disk_bytes -= self._disk.pop(key, 0)
+    
+    def _evict_disk(self) -> None:
+        """Delete least recently used files until the disk tier fits TTS_CACHE_DISK_BYTES"""
+        while self._disk_bytes > Config.TTS_CACHE_DISK_BYTES and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            try:
+                (self._cache_dir / f"{key}.pcm").unlink(missing_ok=True)
+            except OSError:
+                pass
+    
+    def _remember(self, key: str, audio: bytes) -> None:
+        """Add to the memory LRU, evicting until it fits TTS_CACHE_MEMORY_BYTES"""
+        self._cache_bytes -= len(self.cache.pop(key, b""))
+        self.cache[key] = audio
+        self._cache_bytes += len(audio)
+        while self._cache_bytes > Config.TTS_CACHE_MEMORY_BYTES and self.cache:
+            _, old = self.cache.popitem(last=False)
+            self._cache_bytes -= len(old)
     
     def _split_into_chunks(self, text: str) -> list:
         """Split text into speakable chunks"""
         # Split on sentence boundaries
-        import re
-        sentences = re.split(r'([.!?।]\s+)', text)
+        sentences = _SENTENCE_SPLIT.split(text)
         
         chunks = []
-        current = ""
+        current = []  # Sentences of the chunk being built, joined once at the boundary
+        current_len = 0
         
         for i in range(0, len(sentences), 2):
             sentence = sentences[i]
             if i + 1 < len(sentences):
                 sentence += sentences[i + 1]
             
-            if len(current) + len(sentence) < 100:
-                current += sentence
+            if current_len + len(sentence) < 100:
+                current.append(sentence)
+                current_len += len(sentence)
             else:
                 if current:
-                    chunks.append(current.strip())
-                current = sentence
+                    chunks.append(''.join(current).strip())
+                current = [sentence]
+                current_len = len(sentence)
         
         if current:
-            chunks.append(current.strip())
+            chunks.append(''.join(current).strip())
         
         return chunks
 
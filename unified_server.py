@@ -6,24 +6,37 @@ Fixed for Render.com deployment with proper WebSocket handling.
 """
 
 import asyncio
+import gzip
+import hashlib
 import os
+import re
 import json
-import mimetypes
+import multiprocessing
+import socket
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
 from http import HTTPStatus
 
-# Fix for Windows event loop
 import sys
-if sys.platform == 'win32':
-    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
 import websockets
 from websockets.server import serve
 
+try:
+    import brotli
+except ImportError:
+    brotli = None  # gzip only
+
 # Get port from environment (Render sets this)
 PORT = int(os.environ.get("PORT", 8080))
 HOST = "0.0.0.0"
 
+# Worker processes sharing PORT via SO_REUSEPORT; each loads its own models, so mind the RAM
+WORKERS = int(os.environ.get("WORKERS", 1))
+
+# Per-HTTP-request log lines (every health probe and asset fetch) - off unless debugging
+LOG_REQUESTS = os.environ.get("LOG_REQUESTS", "False").lower() == "true"
+
 # Static file directory
 STATIC_DIR = Path(__file__).parent
 
@@ -31,7 +44,7 @@ STATIC_DIR = Path(__file__).parent
 _orchestrator = None
 
 def get_orchestrator():
-    """Get or create global orchestrator"""
+    """Get or create global orchestrator (built once in main(); requests and connections only reuse it)"""
     global _orchestrator
     if _orchestrator is None:
         from streaming_server import StreamingOrchestrator
@@ -54,45 +67,129 @@ MIME_TYPES = {
 }
 
 
-def get_mime_type(path: str) -> str:
-    """Get MIME type for file"""
-    ext = Path(path).suffix.lower()
-    return MIME_TYPES.get(ext, 'application/octet-stream')
+# Text assets worth serving gzipped
+COMPRESSIBLE = {'.html', '.css', '.js', '.json', '.svg'}
+
+# Assets are held in RAM (per worker); anything bigger belongs on a CDN / object storage
+STATIC_MAX_BYTES = 8 * 1024 * 1024
+
 
+def get_mime_type(path: str, _find=MIME_TYPES.get) -> str:
+    """Get MIME type for file (plain string suffix, no Path object)"""
+    i = path.rfind('.')
+    return _find(path[i:].lower(), 'application/octet-stream') if i >= 0 else 'application/octet-stream'
 
-async def serve_static_file(path: str):
-    """Serve static file, returns (status, headers, body)"""
-    # Default to index
-    if path == "/" or path == "":
-        path = "/krishna_complete.html"
+
+# Content-hashed names (app.3f9a1c2b.js) never change under the same URL - cache them for good
+_FINGERPRINTED = re.compile(r'\.[0-9a-f]{8,}\.')
+
+# URL path -> (etag, mtime, 200 response, 200 gzip / brotli responses or None, 304 response), filled
+# by load_static_files(). Responses are complete (status, headers, body) tuples built once;
+# websockets copies the header list itself.
+_STATIC_FILES = {}
+
+
+def _static_entry(file_path: Path) -> tuple:
+    """Read one asset and prebuild every response it can produce"""
+    content = file_path.read_bytes()
+    # Weak: the gzip and identity encodings share it
+    etag = f'W/"{hashlib.blake2b(content, digest_size=16).hexdigest()}"'
+    mtime = int(file_path.stat().st_mtime)  # HTTP dates have 1s resolution
     
-    # Security: prevent path traversal
-    file_path = STATIC_DIR / path.lstrip("/")
-    try:
-        file_path = file_path.resolve()
-        if not str(file_path).startswith(str(STATIC_DIR.resolve())):
-            return (HTTPStatus.FORBIDDEN, [], b"Forbidden")
-    except:
-        return (HTTPStatus.FORBIDDEN, [], b"Forbidden")
+    # Other assets keep their names across deploys: "no-cache" + validators, so browsers
+    # revalidate every load and unchanged assets cost a bodiless 304
+    if _FINGERPRINTED.search(file_path.name):
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "no-cache"
+    validators = [("ETag", etag), ("Last-Modified", formatdate(mtime, usegmt=True)), ("Cache-Control", cache_control)]
+    headers = [("Content-Type", get_mime_type(file_path.name)), ("Access-Control-Allow-Origin", "*"), *validators]
     
-    # Check if file exists
-    if not file_path.exists() or not file_path.is_file():
-        return (HTTPStatus.NOT_FOUND, [], b"Not Found")
+    gzipped = compressed_br = None
+    if file_path.suffix.lower() in COMPRESSIBLE:
+        gzipped = gzip.compress(content, compresslevel=9)
+        if brotli is not None:
+            compressed_br = brotli.compress(content, quality=11)
+    # Only keep encodings that actually shrink the asset
+    variants = [(encoding, body) for encoding, body in (("gzip", gzipped), ("br", compressed_br))
+                if body is not None and len(body) < len(content)]
+    if variants:
+        headers.append(("Vary", "Accept-Encoding"))
+    encoded = {encoding: (HTTPStatus.OK, headers + [("Content-Encoding", encoding), ("Content-Length", str(len(body)))], body)
+               for encoding, body in variants}
     
-    # Read and serve file
-    try:
-        content = file_path.read_bytes()
-        mime_type = get_mime_type(str(file_path))
-        headers = [
-            ("Content-Type", mime_type),
-            ("Content-Length", str(len(content))),
-            ("Access-Control-Allow-Origin", "*"),
-            ("Cache-Control", "no-cache"),
-        ]
-        return (HTTPStatus.OK, headers, content)
-    except Exception as e:
-        print(f"Error serving {file_path}: {e}")
-        return (HTTPStatus.INTERNAL_SERVER_ERROR, [], b"Internal Server Error")
+    ok = (HTTPStatus.OK, headers + [("Content-Length", str(len(content)))], content)
+    return etag, mtime, ok, encoded.get("gzip"), encoded.get("br"), (HTTPStatus.NOT_MODIFIED, validators, b"")
+
+
+def load_static_files():
+    """
+    Read the client assets into memory once: top-level files with a known web MIME type.
+    Nothing else under STATIC_DIR (.env, sources, data/, chroma_db/) is ever served.
+    """
+    files = {}
+    for file_path in sorted(STATIC_DIR.iterdir()):
+        ext = file_path.suffix.lower()
+        if file_path.name.startswith('.') or ext not in MIME_TYPES or not file_path.is_file():
+            continue
+        if file_path.stat().st_size > STATIC_MAX_BYTES:
+            print(f"⚠️ Not serving {file_path.name}: larger than {STATIC_MAX_BYTES // 1024} KB")
+            continue
+        files["/" + file_path.name] = _static_entry(file_path)
+    
+    print(f"📦 Cached {len(files)} static files: {', '.join(files)}")
+    if "/krishna_complete.html" in files:
+        files["/"] = files["/krishna_complete.html"]  # index
+    
+    _STATIC_FILES.clear()
+    _STATIC_FILES.update(files)
+
+
+def _not_modified(request_headers, etag: str, mtime: int) -> bool:
+    """Conditional GET: If-None-Match wins; If-Modified-Since only counts without it"""
+    if_none_match = request_headers.get("If-None-Match")
+    if if_none_match is not None:
+        # Weak comparison, as RFC 9110 requires for If-None-Match
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+    
+    if_modified_since = request_headers.get("If-Modified-Since")
+    if if_modified_since:
+        try:
+            return mtime <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+_NOT_FOUND = (HTTPStatus.NOT_FOUND, [], b"Not Found")
+
+_HEALTH_BODY = b'{"status":"healthy","service":"krishna-voice"}'
+_HEALTH = (HTTPStatus.OK, [("Content-Type", "application/json"), ("Content-Length", str(len(_HEALTH_BODY)))], _HEALTH_BODY)
+
+
+async def serve_static_file(path: str, request_headers=None):
+    """Serve static file from the in-memory cache, returns (status, headers, body)"""
+    if not _STATIC_FILES:
+        load_static_files()
+    
+    # Ignore query strings (cache busters). The key set was fixed at load time and
+    # nothing touches the filesystem here, so there is no path to traverse.
+    entry = _STATIC_FILES.get(path.split("?", 1)[0])
+    if entry is None:
+        return _NOT_FOUND
+    
+    etag, mtime, ok, ok_gzip, ok_br, not_modified = entry
+    
+    request_headers = request_headers or {}
+    if _not_modified(request_headers, etag, mtime):
+        return not_modified
+    accept_encoding = request_headers.get("Accept-Encoding", "")
+    if ok_br is not None and "br" in accept_encoding:
+        return ok_br
+    if ok_gzip is not None and "gzip" in accept_encoding:
+        return ok_gzip
+    return ok
 
 
 async def process_request(path, request_headers):
@@ -103,32 +200,37 @@ async def process_request(path, request_headers):
         - None: Allow WebSocket upgrade (for /ws endpoint)
         - Tuple: Return HTTP response (for static files)
     """
-    print(f"📨 Request: {path}")
+    if LOG_REQUESTS:
+        print(f"📨 Request: {path}")
     
     # Health check endpoint
     if path == "/health":
-        body = b'{"status":"healthy","service":"krishna-voice"}'
-        return (HTTPStatus.OK, [("Content-Type", "application/json")], body)
+        return _HEALTH
     
-    # WebSocket paths - return None to allow upgrade
-    if path in ["/ws", "/websocket"]:
-        print(f"🔌 WebSocket upgrade request for {path}")
-        return None  # Allow WebSocket upgrade
+    # WebSocket upgrades are only accepted on /ws - return None to let the handshake proceed.
+    # Plain GETs never reach the handshake; they're static requests (so GET /ws is a 404).
+    if request_headers.get("Upgrade", "").lower() == "websocket":
+        if path.split("?", 1)[0] == "/ws":
+            if LOG_REQUESTS:
+                print(f"🔌 WebSocket upgrade request for {path}")
+            return None
+        return _NOT_FOUND
     
     # Serve static files for all other paths
-    return await serve_static_file(path)
+    return await serve_static_file(path, request_headers)
 
 
 async def websocket_handler(websocket):
     """Handle WebSocket connections"""
     try:
-        path = websocket.request.path if hasattr(websocket, 'request') else "/"
-        print(f"🔌 WebSocket connected: {websocket.remote_address} path={path}")
+        if LOG_REQUESTS:
+            # handle_client logs the connection itself
+            path = websocket.request.path if hasattr(websocket, 'request') else "/"
+            print(f"🔌 WebSocket connected: {websocket.remote_address} path={path}")
         
-        # Get the global orchestrator
+        # The global orchestrator only holds the shared STT/LLM/TTS clients and caches;
+        # handle_client serves this connection from its own per-session orchestrator
         orchestrator = get_orchestrator()
-        
-        # Handle the WebSocket connection
         await orchestrator.handle_client(websocket)
         
     except websockets.exceptions.ConnectionClosed as e:
@@ -139,7 +241,48 @@ async def websocket_handler(websocket):
         traceback.print_exc()
 
 
-async def main():
+def configure_event_loop():
+    """Selector loop on Windows; uvloop (C event loop) elsewhere when installed"""
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    else:
+        from streaming_server import use_uvloop
+        use_uvloop()
+
+
+def raise_fd_limit():
+    """Lift the open-file soft limit (often 1024) to the hard cap - each client is a socket"""
+    try:
+        import resource
+    except ImportError:
+        return  # Windows
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            return
+        print(f"📂 Open file limit raised from {soft} to {hard}")
+
+
+def _reuseport_socket():
+    """Listening socket the kernel load-balances across every worker bound to (HOST, PORT)"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((HOST, PORT))
+    sock.setblocking(False)
+    return sock
+
+
+def run_worker(reuse_port=False):
+    """Run one server process (its own event loop, orchestrator and caches)"""
+    configure_event_loop()
+    raise_fd_limit()
+    asyncio.run(main(_reuseport_socket() if reuse_port else None))
+
+
+async def main(sock=None):
     """Start the unified server"""
     print("=" * 60)
     print("🙏 KRISHNA VOICE ASSISTANT - CLOUD DEPLOYMENT")
@@ -151,27 +294,40 @@ async def main():
     # Pre-initialize orchestrator
     print("🔄 Initializing orchestrator...")
     orchestrator = get_orchestrator()
+    await orchestrator.warm_up()
     print("✅ Orchestrator ready")
+    load_static_files()
     
     # Start server
-    async with serve(
-        websocket_handler,
-        HOST,
-        PORT,
-        process_request=process_request,
-        ping_interval=30,
-        ping_timeout=10,
-        max_size=10 * 1024 * 1024,  # 10MB max message
-    ):
-        print(f"✅ Server ready on port {PORT}")
-        print("🎧 Waiting for connections...")
-        await asyncio.Future()  # Run forever
+    listen = {"sock": sock} if sock is not None else {"host": HOST, "port": PORT}
+    try:
+        async with serve(
+            websocket_handler,
+            **listen,
+            backlog=1024,  # default 100; the kernel caps it at net.core.somaxconn
+            process_request=process_request,
+            ping_interval=30,
+            ping_timeout=10,
+            max_size=10 * 1024 * 1024,  # 10MB max message
+            compression=None,  # PCM barely deflates; skip zlib on every audio frame
+        ):
+            print(f"✅ Server ready on port {PORT}")
+            print("🎧 Waiting for connections...")
+            await asyncio.Future()  # Run forever
+    finally:
+        await orchestrator.tts.aclose()
 
 
 if __name__ == "__main__":
     try:
         print("🚀 Starting Krishna Voice Server...")
-        asyncio.run(main())
+        if WORKERS > 1 and hasattr(socket, "SO_REUSEPORT"):
+            print(f"🧵 {WORKERS} workers sharing port {PORT} (SO_REUSEPORT)")
+            for _ in range(WORKERS - 1):
+                multiprocessing.Process(target=run_worker, args=(True,), daemon=True).start()
+            run_worker(reuse_port=True)
+        else:
+            run_worker()
     except KeyboardInterrupt:
         print("\n👋 Server stopped")
     except Exception as e: